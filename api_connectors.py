@@ -1,28 +1,56 @@
 # api_connectors.py
 import os
 import json
+import asyncio
+import collections
+import difflib
+import hashlib
+import random
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import orjson
 import requests
-import google.generativeai as genai
-import openai
+import aiohttp
 from pathlib import Path
 from typing import Tuple, Optional, Dict, Any, List
 import logging
 from dotenv import load_dotenv
+from tenacity import (AsyncRetrying, Retrying, retry_if_exception_type,
+                      stop_after_attempt, wait_exponential_jitter)
 import time
-import itertools # Necesario para la rotación
+
+class StreamInterrupted(Exception):
+    """
+    Un stream murió DESPUÉS de producir texto: lo emitido está incompleto.
+    Se lanza en vez de terminar el generador en silencio para que el caller
+    pueda distinguir "narración completa" de "narración truncada" (y, p.ej.,
+    no cachear la segunda).
+    """
+
 
 class HybridAIConnector:
-    def __init__(self):
+    # Sentinela a nivel de clase: .env se parsea del disco una sola vez por proceso,
+    # aunque se instancien varios conectores (hot-reload en desarrollo, tests, etc.)
+    _dotenv_loaded = False
+
+    def __init__(self, semantic_cache: bool = True):
         """
         Inicializa el conector híbrido de IA con configuración mejorada y rotación.
+
+        Args:
+            semantic_cache: Habilita la capa de cache por similitud (prompts casi idénticos
+                            reutilizan respuestas cacheadas). Poner a False para desactivarla.
         """
-        load_dotenv()
+        if not HybridAIConnector._dotenv_loaded:
+            load_dotenv()
+            HybridAIConnector._dotenv_loaded = True
         self._setup_logger()
         self.timeout = 30
         self.max_retries = 3 # Reducir reintentos para rotar más rápido si falla
         self.retry_delay = 2
-        # self.cache_dir = Path("api_cache") # Cache deshabilitado por simplicidad en este ejemplo
-        # self.cache_dir.mkdir(exist_ok=True)
+        self.cache_dir = Path("api_cache") # Cache persistente de respuestas (SQLite)
+        self.cache_dir.mkdir(exist_ok=True)
 
         self.providers = {
             "gemini": {
@@ -36,7 +64,7 @@ class HybridAIConnector:
                 "payload_template": {"model": "deepseek-chat", "temperature": 0.75, "max_tokens": 4096}
             },
             "openai": {
-                "configured": False, "client": None,
+                "configured": False, "client": None, "async_client": None,
                 # --- ¡CAMBIO IMPORTANTE AQUÍ! ---
                 "model": "gpt-3.5-turbo", # Usar GPT-3.5 Turbo por defecto (más barato)
                 # ---------------------------------
@@ -44,12 +72,156 @@ class HybridAIConnector:
             }
         }
 
+        # Métricas por proveedor para la selección ponderada (ver _pick_provider):
+        # latencia EWMA, contadores de éxito/fallo y un peso estático ajustable
+        # (permite preferir backends baratos bajando el peso de los caros).
+        for provider_cfg in self.providers.values():
+            provider_cfg.update({"ewma_latency": 1.0, "failures": 0, "successes": 0, "weight": 1.0})
+
         self.active_providers_list: List[str] = []
-        self.provider_cycler = None # Iterador para rotación
+        # Sesiones aiohttp POR loop (creadas bajo demanda): una ClientSession
+        # queda ligada al loop que la creó, y reutilizarla desde otro loop
+        # (p.ej. el temporal de query_many_sync tras usar aquery en el loop
+        # del juego) publica futuros en un loop ajeno y revienta en runtime.
+        self._aio_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+        # SDKs pesados (grpc/protobuf/httpx...) importados de forma diferida: un usuario
+        # solo-DeepSeek no paga cientos de ms de import ni decenas de MB de RAM por ellos.
+        self._genai = None # Módulo google.generativeai (solo si hay clave Gemini)
+        self._openai = None # Módulo openai (solo si hay clave OpenAI)
+
+        # Plantillas de payload DeepSeek precalculadas: las consultas hacen una copia
+        # superficial barata y asignan solo "messages", en vez de re-fusionar el
+        # template con {**...} en cada llamada. (Se copia por llamada a propósito:
+        # mutar un dict compartido no sería seguro con hilos/fan-out async.)
+        self._deepseek_payload_base = dict(self.providers["deepseek"]["payload_template"])
+        self._deepseek_stream_base = dict(self._deepseek_payload_base, stream=True)
+
+        # Sesión HTTP persistente (keep-alive) para DeepSeek: reutiliza la conexión
+        # TCP+TLS entre llamadas y ahorra el handshake (~100-300ms) por consulta.
+        # max_retries=0 en el adapter: los reintentos los gestiona nuestro propio bucle.
+        self._http = requests.Session()
+        self._http.mount("https://", requests.adapters.HTTPAdapter(
+            pool_connections=4, pool_maxsize=8, max_retries=0))
+
+        # Cache LRU de respuestas exactas: evita repetir llamadas (y coste) para prompts idénticos.
+        # Clave: (proveedor o "auto", hash del prompt). Acotada por número de entradas para limitar RAM.
+        self._cache: "collections.OrderedDict" = collections.OrderedDict()
+        self._cache_max = 512
+        self._cache_lock = threading.Lock() # query() puede llamarse desde hilos de trabajo
+
+        # Segundo nivel persistente (SQLite en cache_dir): reiniciar el juego ya no
+        # pierde las respuestas cacheadas; la segunda partida arranca con hits
+        # instantáneos. Las entradas caducan (TTL) y el nivel en memoria actúa de
+        # primer nivel para que los hits calientes no paguen el viaje a disco.
+        self._disk_cache_ttl = 86400 # 24h
+        self._disk_lock = threading.Lock() # la conexión SQLite se comparte entre hilos
+        self._disk_cache = self._open_disk_cache()
+
+        # Capa semántica: atrapa prompts casi idénticos que el cache exacto no ve
+        # ("describe la taberna" vs "describe la  taberna."). Se usa similitud Jaccard
+        # sobre tokens normalizados (sin dependencias pesadas de embeddings) con TTL
+        # para no servir hechos viejos de la campaña. OJO: con prompts que comparten
+        # un prefijo largo de instrucciones/contexto, la Jaccard del prompt completo
+        # no distingue "casi idéntico" de "misma escena, tarea distinta"; por eso
+        # además se exige que la última línea (la tarea concreta) coincida casi
+        # exactamente, con una medida sensible al orden (ver _semantic_get).
+        self._semantic_cache_enabled = semantic_cache
+        self._semantic_entries: "collections.deque" = collections.deque(maxlen=256) # (tokens, cola, respuesta, ts)
+        self._semantic_threshold = 0.93
+        self._semantic_tail_threshold = 0.95 # Similitud mínima de la línea de tarea
+        self._semantic_ttl = 24 * 3600 # 24h
+
+        # Single-flight: dos consultas concurrentes con el mismo prompt comparten una
+        # sola llamada API; la segunda espera el Future de la primera en vez de re-pagar.
+        self._inflight: Dict[Tuple[str, bytes], Future] = {}
+        self._inflight_lock = threading.Lock()
+        self._ainflight: Dict[Tuple[str, bytes], Tuple[Any, Any]] = {} # (loop, future) para aquery
         self.configure_providers()
         self._validate_initial_config()
         self._setup_provider_rotation()
 
+        # Tabla de dispatch por proveedor: añadir un backend nuevo es una línea aquí
+        # (y su gemela async) en vez de tocar la cadena if/elif del bucle de consulta.
+        self._dispatchers = {
+            "gemini": self._query_gemini,
+            "deepseek": self._query_deepseek,
+            "openai": self._query_openai,
+        }
+        self._async_dispatchers = {
+            "gemini": self._aquery_gemini,
+            "deepseek": self._aquery_deepseek,
+            "openai": self._aquery_openai,
+        }
+        self._build_retry_policies()
+
+    def _build_retry_policies(self):
+        """
+        Políticas de reintento por proveedor (tenacity). Cada backend reintenta solo
+        sus errores transitorios con backoff exponencial + jitter: OpenAI espera más
+        ante rate-limits, mientras que los errores no transitorios caen directamente
+        a la cascada de failover sin quemar reintentos.
+        """
+        network_errors = (requests.exceptions.RequestException,)
+        self._default_retry_policy = Retrying(
+            stop=stop_after_attempt(self.max_retries),
+            wait=wait_exponential_jitter(initial=self.retry_delay, max=10),
+            retry=retry_if_exception_type(network_errors),
+            reraise=True)
+        # Si el SDK de OpenAI no se importó (sin clave), su política se reduce a la genérica
+        openai_transient = ()
+        if self._openai is not None:
+            openai_transient = (self._openai.RateLimitError, self._openai.APIConnectionError)
+        self._retry_policies = {
+            "gemini": self._default_retry_policy,
+            "deepseek": self._default_retry_policy,
+            "openai": Retrying(
+                stop=stop_after_attempt(self.max_retries),
+                # Los 429 de OpenAI piden esperas largas; errores de red, cortas
+                wait=wait_exponential_jitter(initial=1, max=20),
+                retry=retry_if_exception_type(openai_transient + network_errors),
+                reraise=True),
+        }
+
+        # Gemelas async para aquery: mismas condiciones, espera sin bloquear el loop
+        async_network_errors = (asyncio.TimeoutError, aiohttp.ClientError)
+        self._async_default_retry_policy = AsyncRetrying(
+            stop=stop_after_attempt(self.max_retries),
+            wait=wait_exponential_jitter(initial=self.retry_delay, max=10),
+            retry=retry_if_exception_type(async_network_errors),
+            reraise=True)
+        self._async_retry_policies = {
+            "gemini": self._async_default_retry_policy,
+            "deepseek": self._async_default_retry_policy,
+            "openai": AsyncRetrying(
+                stop=stop_after_attempt(self.max_retries),
+                wait=wait_exponential_jitter(initial=1, max=20),
+                retry=retry_if_exception_type(openai_transient + async_network_errors),
+                reraise=True),
+        }
+
+    def _timed_call(self, provider: str, handler, prompt: str) -> str:
+        """Ejecuta un intento real de API registrando latencia y resultado por proveedor."""
+        t0 = time.perf_counter()
+        try:
+            response_text = handler(prompt)
+            self._record_result(provider, time.perf_counter() - t0, ok=True)
+            return response_text
+        except Exception:
+            self._record_result(provider, time.perf_counter() - t0, ok=False)
+            raise
+
+    async def _timed_acall(self, provider: str, handler, prompt: str) -> str:
+        """Variante async de _timed_call."""
+        t0 = time.perf_counter()
+        try:
+            response_text = await handler(prompt)
+            self._record_result(provider, time.perf_counter() - t0, ok=True)
+            return response_text
+        except Exception:
+            self._record_result(provider, time.perf_counter() - t0, ok=False)
+            raise
+
     def _setup_logger(self):
         self.logger = logging.getLogger("APIConnector")
         if not self.logger.handlers: # Evitar añadir handlers múltiples veces
@@ -67,100 +239,387 @@ class HybridAIConnector:
 
     def configure_providers(self):
         self.logger.info("Configurando proveedores de IA...")
-        # Configura cada uno (sin cambios en estas funciones internas)
-        self._configure_gemini()
-        self._configure_deepseek()
-        self._configure_openai()
-        
-        # Actualiza la lista de activos
+        # Leer las claves del entorno una sola vez y pasarlas a cada sonda,
+        # en vez de que cada helper repita su propio os.getenv.
+        api_keys = {
+            "gemini": os.getenv("GEMINI_API_KEY"),
+            "deepseek": os.getenv("DEEPSEEK_API_KEY"),
+            "openai": os.getenv("OPENAI_API_KEY"),
+        }
+        # Las tres sondas son I/O de red independiente: lanzarlas en paralelo reduce el
+        # arranque al tiempo de la sonda más lenta en vez de la suma de las tres.
+        # No hace falta lock: cada sonda solo escribe en su propio sub-dict de providers.
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            probes = [(self._configure_gemini, api_keys["gemini"]),
+                      (self._configure_deepseek, api_keys["deepseek"]),
+                      (self._configure_openai, api_keys["openai"])]
+            list(executor.map(lambda pair: pair[0](pair[1]), probes))
+
+        # Actualiza la lista de activos (tras la barrera implícita del executor)
         self.active_providers_list = [p for p, cfg in self.providers.items() if cfg['configured']]
-        self.logger.info(f"Proveedores activos detectados: {', '.join(self.active_providers_list) if self.active_providers_list else 'Ninguno'}")
+        # Vista inmutable para chequeos de pertenencia O(1) en los caminos calientes
+        # (query/aquery/query_stream validan specific_provider en cada llamada).
+        self._configured_set = frozenset(self.active_providers_list)
+        self.logger.info("Proveedores activos detectados: %s", ', '.join(self.active_providers_list) if self.active_providers_list else 'Ninguno')
 
-    def _configure_gemini(self):
-        # (Sin cambios aquí, igual que tu versión anterior)
-        if api_key := os.getenv("GEMINI_API_KEY"):
+    # Cache en disco del último modelo Gemini que funcionó (evita re-sondear en cada arranque)
+    GEMINI_MODEL_CACHE = Path.home() / ".cache" / "chatbot-cyd" / "gemini_model.json"
+
+    def _load_cached_gemini_model(self) -> Optional[str]:
+        """Lee el nombre del modelo Gemini usado en el último arranque exitoso, si existe."""
+        try:
+            with open(self.GEMINI_MODEL_CACHE, 'r', encoding='utf-8') as f:
+                return json.load(f).get("model")
+        except (OSError, ValueError):
+            return None
+
+    def _save_cached_gemini_model(self, model_name: str):
+        """Persiste el modelo Gemini activo para probarlo primero en el próximo arranque."""
+        try:
+            self.GEMINI_MODEL_CACHE.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.GEMINI_MODEL_CACHE, 'w', encoding='utf-8') as f:
+                json.dump({"model": model_name, "ts": time.time()}, f)
+        except OSError as e:
+            self.logger.debug("No se pudo guardar el cache de modelo Gemini: %s", e)
+
+    def _configure_gemini(self, api_key: Optional[str]):
+        if api_key:
             try:
+                import google.generativeai as genai # Import diferido (SDK pesado)
+                self._genai = genai
                 genai.configure(api_key=api_key)
-                # Intentar configurar con el primer modelo válido encontrado
+                # Validar la clave con list_models() (metadatos, sin coste) en lugar de
+                # una llamada generate_content facturable por cada modelo candidato.
+                try:
+                    available_models = {m.name for m in genai.list_models()}
+                except Exception as e:
+                    self.logger.error("Error validando clave Gemini (list_models): %s", e)
+                    return
+
+                # Probar primero el modelo que funcionó la última vez (cache en disco)
+                candidates = list(self.providers["gemini"]["models_available"])
+                cached_model = self._load_cached_gemini_model()
+                if cached_model:
+                    if cached_model in candidates:
+                        candidates.remove(cached_model)
+                    candidates.insert(0, cached_model)
+
                 model_instance = None
-                for model_name in self.providers["gemini"]["models_available"]:
+                for model_name in candidates:
+                    if available_models and model_name not in available_models:
+                        self.logger.debug("Modelo Gemini %s no disponible para esta clave.", model_name)
+                        continue
                     try:
-                        test_model = genai.GenerativeModel(model_name)
-                        # Prueba de conexión simple (puede fallar por cuota, pero valida configuración)
-                        test_model.generate_content("Test", generation_config=genai.types.GenerationConfig(max_output_tokens=5))
-                        model_instance = test_model # Guardar la instancia del modelo que funcionó
+                        model_instance = genai.GenerativeModel(model_name)
                         self.providers["gemini"]["model_name_configured"] = model_name # Guardar nombre
-                        self.logger.info(f"Modelo Gemini activo: {model_name}")
-                        break # Usar el primer modelo exitoso
+                        self.logger.info("Modelo Gemini activo: %s", model_name)
+                        self._save_cached_gemini_model(model_name)
+                        break # Usar el primer modelo válido
                     except Exception as model_e:
-                        self.logger.debug(f"Modelo Gemini {model_name} no disponible o falló test: {model_e}")
-                
+                        self.logger.debug("Modelo Gemini %s no disponible o falló: %s", model_name, model_e)
+                        model_instance = None
+
                 if model_instance:
                     self.providers["gemini"]["model"] = model_instance # Guardar la instancia
+                    # Materializar el GenerationConfig una sola vez: el SDK valida y
+                    # convierte el dict en cada generate_content si se pasa crudo.
+                    try:
+                        self.providers["gemini"]["gen_config_obj"] = genai.types.GenerationConfig(
+                            **self.providers["gemini"]["generation_config"])
+                    except Exception as cfg_e:
+                        self.logger.debug("No se pudo precompilar GenerationConfig: %s", cfg_e)
                     self.providers["gemini"]["configured"] = True
                     self.logger.info("Proveedor Gemini configurado exitosamente.")
                 else:
                     self.logger.warning("No se pudo configurar ningún modelo Gemini válido.")
 
             except Exception as e:
-                self.logger.error(f"Error configurando Gemini: {str(e)}")
+                self.logger.error("Error configurando Gemini: %s", str(e))
 
 
-    def _configure_deepseek(self):
-        # (Sin cambios aquí, igual que tu versión anterior)
-         if api_key := os.getenv("DEEPSEEK_API_KEY"):
+    def _configure_deepseek(self, api_key: Optional[str]):
+         if api_key:
             try:
                 self.providers["deepseek"]["headers"]["Authorization"] = f"Bearer {api_key}"
                 test_payload = { "messages": [{"role": "user", "content": "Test"}], "model": "deepseek-chat", "max_tokens": 1 }
-                response = requests.post(
+                response = self._http.post(
                     self.providers["deepseek"]["endpoint"], headers=self.providers["deepseek"]["headers"],
-                    json=test_payload, timeout=10 )
+                    data=orjson.dumps(test_payload), timeout=10 )
                 response.raise_for_status()
                 self.providers["deepseek"]["configured"] = True
                 self.logger.info("Proveedor DeepSeek configurado exitosamente.")
             except Exception as e:
-                self.logger.error(f"Error configurando DeepSeek: {str(e)}")
+                self.logger.error("Error configurando DeepSeek: %s", str(e))
 
 
-    def _configure_openai(self):
-        # (Sin cambios aquí, igual que tu versión anterior)
-        if api_key := os.getenv("OPENAI_API_KEY"):
+    def _configure_openai(self, api_key: Optional[str]):
+        if api_key:
             try:
+                import openai # Import diferido (SDK pesado)
+                self._openai = openai
                 self.providers["openai"]["client"] = openai.OpenAI(api_key=api_key)
                 self.providers["openai"]["client"].models.list() # Test básico
+                # Cliente asíncrono para la ruta aquery (comparte la misma clave)
+                self.providers["openai"]["async_client"] = openai.AsyncOpenAI(api_key=api_key)
                 self.providers["openai"]["configured"] = True
                 self.logger.info("Proveedor OpenAI configurado exitosamente.")
             except Exception as e:
-                self.logger.error(f"Error configurando OpenAI: {str(e)}")
+                self.logger.error("Error configurando OpenAI: %s", str(e))
 
     def _setup_provider_rotation(self):
-        """Configura el iterador para la rotación de proveedores activos."""
+        """Informa qué proveedores participan en la selección ponderada."""
         if self.active_providers_list:
-            # Crear un ciclo infinito sobre la lista de proveedores activos
-            self.provider_cycler = itertools.cycle(self.active_providers_list)
-            self.logger.info(f"Rotación de API habilitada para: {', '.join(self.active_providers_list)}")
+            self.logger.info("Selección ponderada por latencia habilitada para: %s", ', '.join(self.active_providers_list))
+        else:
+            self.logger.warning("Selección de proveedor deshabilitada (no hay proveedores activos).")
+
+    def _pick_provider(self) -> Optional[str]:
+        """
+        Elige un proveedor activo con probabilidad inversamente proporcional a su
+        latencia EWMA y su tasa de fallos reciente. Los backends rápidos y sanos
+        reciben más tráfico; uno degradado recibe menos pero nunca cero, así puede
+        recuperarse (sus fallos además decaen con cada éxito, ver _record_result).
+        """
+        actives = self.active_providers_list
+        if not actives:
+            return None
+        if len(actives) == 1:
+            return actives[0]
+        scores = []
+        for provider in actives:
+            cfg = self.providers[provider]
+            total = cfg["successes"] + cfg["failures"]
+            failure_rate = cfg["failures"] / (total + 1)
+            scores.append(cfg["weight"] / (cfg["ewma_latency"] * (1.0 + failure_rate)))
+        return random.choices(actives, weights=scores, k=1)[0]
+
+    def _record_result(self, provider: str, elapsed: Optional[float], ok: bool):
+        """Actualiza las métricas de latencia/fiabilidad tras cada intento real de API."""
+        cfg = self.providers.get(provider)
+        if not cfg:
+            return
+        if elapsed is not None:
+            cfg["ewma_latency"] = 0.7 * cfg["ewma_latency"] + 0.3 * elapsed
+        if ok:
+            cfg["successes"] += 1
+            # Decaer los fallos antiguos para que un proveedor recuperado vuelva a recibir tráfico
+            if cfg["failures"]:
+                cfg["failures"] -= 1
+        else:
+            cfg["failures"] += 1
+
+    def _failover_order(self, start: Optional[str]):
+        """
+        Genera el orden de failover: primero el proveedor elegido por la rotación,
+        luego el resto de activos en orden de rotación (sin repetir). Así un fallo
+        de un proveedor cae en cascada al siguiente sin desequilibrar el round-robin.
+        """
+        if not start:
+            return
+        yield start
+        actives = self.active_providers_list
+        if start in actives:
+            idx = actives.index(start)
+            rest = actives[idx + 1:] + actives[:idx]
         else:
-            self.provider_cycler = None
-            self.logger.warning("Rotación de API deshabilitada (no hay proveedores activos).")
+            rest = list(actives)
+        for provider in rest:
+            if provider != start:
+                yield provider
+
+    # --- Cache de respuestas (coincidencia exacta) ---
+
+    @staticmethod
+    def _cache_key(prompt: str, specific_provider: Optional[str]) -> Tuple[str, bytes]:
+        """Clave compacta de cache: proveedor pedido (o 'auto') + hash del prompt."""
+        digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).digest()
+        return (specific_provider or "auto", digest)
+
+    def _cache_get(self, key: Tuple[str, bytes]) -> Optional[str]:
+        """Busca en el LRU en memoria y, si falla, en el nivel persistente (promoviendo el hit)."""
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        cached = self._disk_cache_get(key)
+        if cached is not None:
+            # Promover al primer nivel para que los siguientes hits no toquen disco
+            with self._cache_lock:
+                self._cache[key] = cached
+                self._cache.move_to_end(key)
+                while len(self._cache) > self._cache_max:
+                    self._cache.popitem(last=False)
+        return cached
+
+    def _cache_put(self, key: Tuple[str, bytes], response_text: str):
+        """Inserta una respuesta exitosa (memoria + disco), expulsando la más antigua del LRU."""
+        with self._cache_lock:
+            self._cache[key] = response_text
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_max:
+                self._cache.popitem(last=False)
+        self._disk_cache_put(key, response_text)
+
+    def _open_disk_cache(self) -> Optional[sqlite3.Connection]:
+        """Abre (o crea) la base SQLite del cache persistente. Devuelve None si falla."""
+        try:
+            conn = sqlite3.connect(str(self.cache_dir / "responses.db"), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL") # escrituras baratas, lectores no bloquean
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " scope TEXT NOT NULL, digest BLOB NOT NULL, response TEXT NOT NULL,"
+                " ts REAL NOT NULL, PRIMARY KEY (scope, digest))")
+            # Limpieza de entradas caducadas al arrancar (mantiene el fichero acotado)
+            conn.execute("DELETE FROM responses WHERE ts < ?", (time.time() - self._disk_cache_ttl,))
+            conn.commit()
+            return conn
+        except Exception as e:
+            self.logger.warning("Cache persistente deshabilitado (error abriendo SQLite): %s", e)
+            return None
+
+    def _disk_cache_get(self, key: Tuple[str, bytes]) -> Optional[str]:
+        if self._disk_cache is None:
+            return None
+        try:
+            with self._disk_lock:
+                row = self._disk_cache.execute(
+                    "SELECT response, ts FROM responses WHERE scope = ? AND digest = ?", key).fetchone()
+        except Exception as e:
+            self.logger.debug("Error leyendo cache persistente: %s", e)
+            return None
+        if row is None or time.time() - row[1] > self._disk_cache_ttl:
+            return None
+        return row[0]
+
+    def _disk_cache_put(self, key: Tuple[str, bytes], response_text: str):
+        if self._disk_cache is None:
+            return
+        try:
+            with self._disk_lock:
+                self._disk_cache.execute(
+                    "INSERT OR REPLACE INTO responses (scope, digest, response, ts) VALUES (?, ?, ?, ?)",
+                    (key[0], key[1], response_text, time.time()))
+                self._disk_cache.commit()
+        except Exception as e:
+            self.logger.debug("Error escribiendo cache persistente: %s", e)
 
-    def _get_next_provider(self) -> Optional[str]:
-        """Obtiene el siguiente proveedor de la rotación."""
-        if self.provider_cycler:
-            return next(self.provider_cycler)
+    @staticmethod
+    def _semantic_tokens(prompt: str) -> frozenset:
+        """Normaliza el prompt a un conjunto de tokens (minúsculas, sin puntuación en los bordes)."""
+        return frozenset(tok.strip(".,;:¡!¿?\"'()[]") for tok in prompt.lower().split())
+
+    @staticmethod
+    def _semantic_tail(prompt: str) -> str:
+        """
+        Última línea no vacía del prompt, normalizada. Cuando las llamadas
+        comparten un prefijo grande (instrucciones fijas + contexto), esa línea
+        final es la parte que de verdad distingue una petición de otra: la
+        tarea/acción concreta que se pide procesar.
+        """
+        for line in reversed(prompt.splitlines()):
+            line = " ".join(line.lower().split())
+            if line:
+                return line
+        return ""
+
+    def _semantic_get(self, prompt: str) -> Optional[str]:
+        """
+        Busca una respuesta cacheada para un prompt semánticamente casi idéntico.
+        La Jaccard de tokens sobre el prompt completo actúa de prefiltro barato;
+        como los conjuntos ignoran orden y repeticiones, dos prompts de la misma
+        escena con TAREAS distintas también la superan, así que el hit requiere
+        además que la línea de tarea coincida casi exactamente (SequenceMatcher,
+        sensible al orden de los caracteres).
+        """
+        if not self._semantic_cache_enabled:
+            return None
+        query_tokens = self._semantic_tokens(prompt)
+        if not query_tokens:
+            return None
+        query_tail = self._semantic_tail(prompt)
+        now = time.time()
+        best_sim, best_tail_sim, best_response = 0.0, 0.0, None
+        with self._cache_lock:
+            for tokens, tail, response_text, ts in self._semantic_entries:
+                if now - ts > self._semantic_ttl:
+                    continue # Entrada caducada (TTL): no servir datos viejos
+                inter = len(query_tokens & tokens)
+                if not inter:
+                    continue
+                sim = inter / len(query_tokens | tokens) # Similitud Jaccard
+                if sim < self._semantic_threshold:
+                    continue
+                # Prefiltro superado: verificar la tarea concreta (solo aquí se
+                # paga el SequenceMatcher, nunca sobre toda la deque)
+                tail_sim = difflib.SequenceMatcher(None, query_tail, tail).ratio()
+                if tail_sim < self._semantic_tail_threshold:
+                    continue # Misma escena pero otra tarea: NO es la misma petición
+                if (sim, tail_sim) > (best_sim, best_tail_sim):
+                    best_sim, best_tail_sim, best_response = sim, tail_sim, response_text
+        if best_response is not None:
+            self.logger.info("semantic_hit: similitud %.2f (tarea %.2f), respuesta servida desde cache.",
+                             best_sim, best_tail_sim)
+            return best_response
         return None
 
-    def query(self, prompt: str, specific_provider: Optional[str] = None) -> Tuple[str, str]:
+    def _semantic_put(self, prompt: str, response_text: str):
+        """Registra una respuesta exitosa en la capa semántica."""
+        if not self._semantic_cache_enabled:
+            return
+        tokens = self._semantic_tokens(prompt)
+        if tokens:
+            with self._cache_lock:
+                self._semantic_entries.append((tokens, self._semantic_tail(prompt), response_text, time.time()))
+
+    def query(self, prompt: str, specific_provider: Optional[str] = None, use_cache: bool = True) -> Tuple[str, str]:
         """
         Ejecuta una consulta usando el siguiente proveedor en rotación (o uno específico).
         Manejo robusto de errores y reintentos para el proveedor seleccionado.
+        Los prompts ya respondidos se sirven desde un cache LRU en memoria (estado 'success_cache').
 
         Args:
             prompt: Texto de entrada para la consulta.
             specific_provider: Si se proporciona, intenta usar este proveedor en lugar de rotar.
+            use_cache: Poner a False para forzar una llamada real (ej: re-tiradas estocásticas).
 
         Returns:
-            Tupla con (respuesta, estado: 'success', 'error', 'timeout')
+            Tupla con (respuesta, estado: 'success', 'success_cache', 'error', 'timeout')
         """
+        cache_key = self._cache_key(prompt, specific_provider)
+        if use_cache:
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                self.logger.debug("Cache hit exacto; respuesta servida sin llamada API.")
+                return cached, "success_cache"
+            semantic_hit = self._semantic_get(prompt)
+            if semantic_hit is not None:
+                return semantic_hit, "success_cache"
+
+        # Single-flight: deduplicar consultas idénticas que ya estén en vuelo
+        with self._inflight_lock:
+            existing = self._inflight.get(cache_key)
+            if existing is None:
+                future = Future()
+                self._inflight[cache_key] = future
+        if existing is not None:
+            self.logger.debug("Consulta idéntica en vuelo; esperando su resultado (single-flight).")
+            return existing.result()
+
+        try:
+            result = self._query_uncached(prompt, specific_provider, use_cache, cache_key)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(cache_key, None)
+
+    def _query_uncached(self, prompt: str, specific_provider: Optional[str],
+                        use_cache: bool, cache_key: Tuple[str, bytes]) -> Tuple[str, str]:
+        """Cuerpo real de query(): selección de proveedor, reintentos y failover."""
         if not self.active_providers_list:
             self.logger.error("Intento de consulta sin proveedores activos.")
             return self._fallback_response(prompt, "No hay proveedores configurados"), "error"
@@ -169,106 +628,441 @@ class HybridAIConnector:
         status = "error" # Estado por defecto
 
         if specific_provider:
-            if specific_provider in self.providers and self.providers[specific_provider]["configured"]:
+            if specific_provider in self._configured_set:
                 provider_to_use = specific_provider
             else:
-                self.logger.warning(f"Proveedor específico '{specific_provider}' no está configurado o no existe. Usando rotación.")
-                provider_to_use = self._get_next_provider()
+                self.logger.warning("Proveedor específico '%s' no está configurado o no existe. Usando rotación.", specific_provider)
+                provider_to_use = self._pick_provider()
         else:
             # --- Lógica de Rotación ---
-            provider_to_use = self._get_next_provider()
+            provider_to_use = self._pick_provider()
             # ------------------------
 
         if not provider_to_use: # Si la rotación falla (no debería pasar si hay activos)
              self.logger.error("No se pudo seleccionar un proveedor para la consulta.")
              return self._fallback_response(prompt, "Fallo interno al seleccionar proveedor"), "error"
 
-        self.logger.info(f"Intentando consulta con: {provider_to_use}")
+        # Cascada de failover: si un proveedor agota sus reintentos, probar con el siguiente
+        # activo en vez de devolver error al usuario. Se acumulan los errores por backend.
+        provider_errors: List[str] = []
+        for provider_to_use in self._failover_order(provider_to_use):
+            self.logger.info("Intentando consulta con: %s", provider_to_use)
+            status = "error"
 
-        # Intenta la consulta con el proveedor seleccionado, con reintentos
-        for attempt in range(self.max_retries):
+            # La política tenacity del proveedor gestiona reintentos, backoff y jitter;
+            # si agota sus intentos (reraise=True) el error original cae aquí y se
+            # clasifica para decidir el failover.
+            policy = self._retry_policies.get(provider_to_use, self._default_retry_policy)
             try:
-                self.logger.debug(f"Intento {attempt + 1}/{self.max_retries} con {provider_to_use}")
-                response_text = ""
-
-                if provider_to_use == "gemini":
-                    response_text = self._query_gemini(prompt)
-                elif provider_to_use == "deepseek":
-                    response_text = self._query_deepseek(prompt)
-                elif provider_to_use == "openai":
-                    response_text = self._query_openai(prompt)
-                else:
+                handler = self._dispatchers.get(provider_to_use)
+                if handler is None:
                     # Esto no debería ocurrir si la lista de activos es correcta
                     raise ValueError(f"Proveedor desconocido encontrado en rotación: {provider_to_use}")
+                response_text = policy(self._timed_call, provider_to_use, handler, prompt)
 
-                # Éxito en este intento
+                if use_cache:
+                    self._cache_put(cache_key, response_text)
+                    self._semantic_put(prompt, response_text)
                 return response_text, "success"
 
             except requests.exceptions.Timeout:
-                self.logger.warning(f"Timeout en intento {attempt + 1} con {provider_to_use}")
-                status = "timeout" # Marcar como timeout si todos los reintentos fallan
-                # No romper el bucle, reintentar
+                self.logger.warning("Timeout con %s (reintentos agotados)", provider_to_use)
+                status = "timeout"
             except requests.exceptions.RequestException as req_err:
-                 self.logger.warning(f"Error de red en intento {attempt + 1} con {provider_to_use}: {req_err}")
-                 status = "error_network"
-                 # No romper el bucle, reintentar
+                self.logger.warning("Error de red con %s (reintentos agotados): %s", provider_to_use, req_err)
+                status = "error_network"
             except Exception as e:
-                self.logger.error(f"Error inesperado en intento {attempt + 1} con {provider_to_use}: {str(e)}", exc_info=False) # exc_info=True para traceback completo
-                status = "error_provider" # Marcar como error del proveedor
-                # Romper el bucle si es un error del proveedor (probablemente no se arregle reintentando)
-                # OJO: Podrías decidir reintentar también aquí, depende de la causa del error.
-                # Por ahora, rompemos para evitar gastar reintentos en errores persistentes.
-                break 
-
-            # Si no fue éxito y quedan reintentos, esperar antes del siguiente
-            if attempt < self.max_retries - 1:
-                self._handle_retry_delay(attempt)
-            
-        # Si todos los reintentos fallaron para este proveedor
-        self.logger.error(f"Consulta fallida para '{provider_to_use}' después de {self.max_retries} intentos. Estado final: {status}")
-        # Podrías intentar con el SIGUIENTE proveedor aquí como fallback avanzado,
-        # pero por ahora, devolvemos el fallo.
-        return self._fallback_response(prompt, f"Fallaron todos los intentos con {provider_to_use} ({status})"), status
-
-
-    def _handle_retry_delay(self, attempt: int):
-        # (Sin cambios aquí)
-        delay = self.retry_delay * (2 ** attempt) + random.uniform(0, 0.5) # Añadir jitter
-        self.logger.info(f"Esperando {delay:.2f} segundos antes de reintentar...")
-        time.sleep(delay)
+                self.logger.error("Error del proveedor %s: %s", provider_to_use, str(e), exc_info=False) # exc_info=True para traceback completo
+                status = "error_provider"
+
+            # Proveedor agotado: registrar y pasar al siguiente de la cascada
+            provider_errors.append(f"{provider_to_use}: {status}")
+            self.logger.error("Consulta fallida para '%s' (%s). Probando siguiente proveedor...", provider_to_use, status)
+
+        # Todos los proveedores activos agotados
+        self.logger.error("Consulta fallida en todos los proveedores: %s", '; '.join(provider_errors))
+        return self._fallback_response(prompt, f"Fallaron todos los proveedores ({'; '.join(provider_errors)})"), status
+
+    # --- Streaming (tokens a medida que llegan) ---
+
+    def query_stream(self, prompt: str, specific_provider: Optional[str] = None):
+        """
+        Devuelve un generador de fragmentos de texto: el caller recibe el primer
+        token en <1s en vez de esperar la respuesta completa (la GUI puede pintar
+        la narración a medida que llega). Si un proveedor falla antes de producir
+        nada se prueba el siguiente de la cascada; una vez iniciado el stream no
+        hay reintentos (no se puede retomar a mitad): en ese caso se lanza
+        StreamInterrupted para que el caller sepa que lo recibido está truncado.
+        Lanza RuntimeError si ningún proveedor pudo iniciar el stream, para que
+        el caller caiga a query().
+        """
+        streamers = {
+            "gemini": self._stream_gemini,
+            "deepseek": self._stream_deepseek,
+            "openai": self._stream_openai,
+        }
+
+        if specific_provider and specific_provider in self._configured_set:
+            start = specific_provider
+        else:
+            start = self._pick_provider()
+
+        for provider in self._failover_order(start):
+            streamer = streamers.get(provider)
+            if streamer is None:
+                continue
+            self.logger.info("Intentando stream con: %s", provider)
+            produced = False
+            t0 = time.perf_counter()
+            try:
+                for chunk in streamer(prompt):
+                    if chunk:
+                        produced = True
+                        yield chunk
+                if produced:
+                    self._record_result(provider, time.perf_counter() - t0, ok=True)
+                    return
+            except Exception as e:
+                self._record_result(provider, time.perf_counter() - t0, ok=False)
+                if produced:
+                    # Stream cortado a mitad: no mezclar narraciones de dos
+                    # proveedores, y avisar al caller de que el texto está
+                    # incompleto (terminar en silencio lo haría indistinguible
+                    # de un stream terminado bien)
+                    self.logger.error("Stream interrumpido con %s: %s", provider, e)
+                    raise StreamInterrupted(f"Stream de {provider} cortado a mitad: {e}") from e
+                self.logger.warning("No se pudo iniciar stream con %s: %s. Probando siguiente...", provider, e)
+
+        raise RuntimeError("Ningún proveedor pudo iniciar el streaming.")
+
+    def _stream_openai(self, prompt: str):
+        """Generador de fragmentos OpenAI (stream=True)."""
+        provider = self.providers["openai"]
+        if not provider["client"]:
+            raise RuntimeError("Cliente OpenAI no inicializado.")
+        stream = provider["client"].chat.completions.create(
+            model=provider["model"],
+            messages=[{"role": "user", "content": prompt}],
+            temperature=provider["params"]["temperature"],
+            max_tokens=provider["params"]["max_tokens"],
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def _stream_deepseek(self, prompt: str):
+        """Generador de fragmentos DeepSeek parseando los frames SSE 'data: {...}'."""
+        provider = self.providers["deepseek"]
+        payload = dict(self._deepseek_stream_base)
+        payload["messages"] = [{"role": "user", "content": prompt}]
+        response = self._http.post(provider["endpoint"], headers=provider["headers"],
+                                   data=orjson.dumps(payload), timeout=self.timeout, stream=True)
+        response.raise_for_status()
+        try:
+            for raw_line in response.iter_lines():
+                if not raw_line:
+                    continue
+                line = raw_line.decode("utf-8") if isinstance(raw_line, bytes) else raw_line
+                if not line.startswith("data:"):
+                    continue
+                data_str = line[len("data:"):].strip()
+                if data_str == "[DONE]":
+                    break
+                try:
+                    data = orjson.loads(data_str)
+                except ValueError:
+                    continue # Frame malformado: ignorar y seguir
+                choices = data.get("choices")
+                if choices and choices[0].get("delta", {}).get("content"):
+                    yield choices[0]["delta"]["content"]
+        finally:
+            response.close()
+
+    def _stream_gemini(self, prompt: str):
+        """Generador de fragmentos Gemini (generate_content con stream=True)."""
+        model = self.providers["gemini"]["model"]
+        if not model:
+            raise RuntimeError("Modelo Gemini no está instanciado correctamente.")
+        gen_config = self.providers["gemini"].get("gen_config_obj") or self.providers["gemini"]["generation_config"]
+        for chunk in model.generate_content(
+                prompt,
+                generation_config=gen_config,
+                stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                continue # Fragmento bloqueado o sin texto
+            if text:
+                yield text
+
+    # --- Ruta Asíncrona (aiohttp / SDKs async) ---
+
+    async def _get_aio_session(self) -> aiohttp.ClientSession:
+        """
+        Devuelve la sesión aiohttp del loop actualmente en ejecución, creándola
+        si es necesario (debe llamarse dentro del loop). Cada loop usa SU
+        sesión: así query_many_sync (loop temporal) nunca toca la sesión del
+        loop persistente del juego ni viceversa.
+        """
+        loop = asyncio.get_running_loop()
+        session = self._aio_sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._aio_sessions[loop] = session
+        return session
+
+    async def aclose(self):
+        """
+        Cierra la sesión aiohttp del loop actual. Llamar al terminar si se usó
+        aquery. Las sesiones de otros loops no se tocan (cerrarlas desde aquí
+        operaría sobre un loop ajeno); cada loop cierra la suya.
+        """
+        session = self._aio_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def close(self):
+        """Cierra la sesión HTTP persistente y la conexión del cache en disco."""
+        try:
+            self._http.close()
+        except Exception:
+            pass
+        if self._disk_cache is not None:
+            try:
+                self._disk_cache.close()
+            except Exception:
+                pass
+
+    def __del__(self):
+        # Mejor esfuerzo: liberar sockets si el caller olvidó llamar a close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    async def aquery(self, prompt: str, specific_provider: Optional[str] = None, use_cache: bool = True) -> Tuple[str, str]:
+        """
+        Versión asíncrona de query(): no bloquea el hilo llamante durante la espera de red,
+        por lo que un caller puede lanzar varias consultas concurrentes con asyncio.gather.
+        Misma semántica de rotación, reintentos, cache y retorno (respuesta, estado) que query().
+        """
+        cache_key = self._cache_key(prompt, specific_provider)
+        if use_cache:
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                self.logger.debug("Cache hit exacto (async); respuesta servida sin llamada API.")
+                return cached, "success_cache"
+            semantic_hit = self._semantic_get(prompt)
+            if semantic_hit is not None:
+                return semantic_hit, "success_cache"
+
+        # Single-flight async: consultas idénticas dentro del mismo loop comparten una llamada
+        loop = asyncio.get_running_loop()
+        entry = self._ainflight.get(cache_key)
+        if entry is not None and entry[0] is loop:
+            self.logger.debug("Consulta async idéntica en vuelo; esperando su resultado (single-flight).")
+            return await entry[1]
+        afuture = loop.create_future()
+        self._ainflight[cache_key] = (loop, afuture)
+        try:
+            result = await self._aquery_uncached(prompt, specific_provider, use_cache, cache_key)
+            afuture.set_result(result)
+            return result
+        except BaseException as e:
+            afuture.set_exception(e)
+            raise
+        finally:
+            self._ainflight.pop(cache_key, None)
+
+    async def _aquery_uncached(self, prompt: str, specific_provider: Optional[str],
+                               use_cache: bool, cache_key: Tuple[str, bytes]) -> Tuple[str, str]:
+        """Cuerpo real de aquery(): selección de proveedor, reintentos y failover."""
+        if not self.active_providers_list:
+            self.logger.error("Intento de consulta async sin proveedores activos.")
+            return self._fallback_response(prompt, "No hay proveedores configurados"), "error"
+
+        provider_to_use = None
+        status = "error"
+
+        if specific_provider:
+            if specific_provider in self._configured_set:
+                provider_to_use = specific_provider
+            else:
+                self.logger.warning("Proveedor específico '%s' no está configurado o no existe. Usando rotación.", specific_provider)
+                provider_to_use = self._pick_provider()
+        else:
+            provider_to_use = self._pick_provider()
+
+        if not provider_to_use:
+            self.logger.error("No se pudo seleccionar un proveedor para la consulta async.")
+            return self._fallback_response(prompt, "Fallo interno al seleccionar proveedor"), "error"
+
+        # Cascada de failover async: misma lógica que en query()
+        provider_errors: List[str] = []
+        for provider_to_use in self._failover_order(provider_to_use):
+            self.logger.info("Intentando consulta async con: %s", provider_to_use)
+            status = "error"
+
+            # Igual que en query() pero con AsyncRetrying: el backoff usa asyncio.sleep
+            # internamente y nunca bloquea el event loop.
+            policy = self._async_retry_policies.get(provider_to_use, self._async_default_retry_policy)
+            try:
+                handler = self._async_dispatchers.get(provider_to_use)
+                if handler is None:
+                    raise ValueError(f"Proveedor desconocido encontrado en rotación: {provider_to_use}")
+                response_text = await policy(self._timed_acall, provider_to_use, handler, prompt)
+
+                if use_cache:
+                    self._cache_put(cache_key, response_text)
+                    self._semantic_put(prompt, response_text)
+                return response_text, "success"
+
+            except asyncio.TimeoutError:
+                self.logger.warning("Timeout async con %s (reintentos agotados)", provider_to_use)
+                status = "timeout"
+            except aiohttp.ClientError as req_err:
+                self.logger.warning("Error de red async con %s (reintentos agotados): %s", provider_to_use, req_err)
+                status = "error_network"
+            except Exception as e:
+                self.logger.error("Error del proveedor (async) %s: %s", provider_to_use, str(e), exc_info=False)
+                status = "error_provider"
+
+            provider_errors.append(f"{provider_to_use}: {status}")
+            self.logger.error("Consulta async fallida para '%s' (%s). Probando siguiente proveedor...", provider_to_use, status)
+
+        self.logger.error("Consulta async fallida en todos los proveedores: %s", '; '.join(provider_errors))
+        return self._fallback_response(prompt, f"Fallaron todos los proveedores ({'; '.join(provider_errors)})"), status
+
+    async def query_many(self, prompts: List[str], per_provider_concurrency: int = 4) -> List[Tuple[str, str]]:
+        """
+        Resuelve N prompts independientes en paralelo con asyncio.gather.
+        Cada prompt se asigna a un proveedor vía _pick_provider() y un semáforo por
+        proveedor limita cuántas llamadas simultáneas recibe cada backend, así el
+        fan-out reparte la carga en vez de martillear a un solo proveedor.
+        El tiempo total pasa de N*latencia a ~ceil(N/concurrencia)*latencia.
+
+        Returns:
+            Lista de tuplas (respuesta, estado) en el mismo orden que los prompts.
+        """
+        if not prompts:
+            return []
+        semaphores = {p: asyncio.Semaphore(per_provider_concurrency) for p in self.active_providers_list}
+
+        async def bounded_call(prompt: str) -> Tuple[str, str]:
+            provider = self._pick_provider()
+            semaphore = semaphores.get(provider)
+            if semaphore is None:
+                # Sin proveedores activos: aquery devolverá el fallback correspondiente
+                return await self.aquery(prompt)
+            async with semaphore:
+                # La cascada de failover de aquery sigue aplicando por tarea
+                return await self.aquery(prompt, specific_provider=provider)
+
+        return list(await asyncio.gather(*(bounded_call(p) for p in prompts)))
+
+    def query_many_sync(self, prompts: List[str], per_provider_concurrency: int = 4) -> List[Tuple[str, str]]:
+        """
+        Envoltorio síncrono de query_many para los callers con hilos (ej: la GUI).
+        Crea un loop temporal con su propia sesión aiohttp, que se cierra al
+        terminar; la sesión de un loop persistente (p.ej. el del juego) no se
+        ve afectada.
+        """
+        async def _run():
+            try:
+                return await self.query_many(prompts, per_provider_concurrency)
+            finally:
+                await self.aclose()
+
+        return asyncio.run(_run())
+
+    async def _aquery_deepseek(self, prompt: str) -> str:
+        """Variante no bloqueante de _query_deepseek usando aiohttp."""
+        provider = self.providers["deepseek"]
+        payload = dict(self._deepseek_payload_base)
+        payload["messages"] = [{"role": "user", "content": prompt}]
+        session = await self._get_aio_session()
+        async with session.post(provider["endpoint"], headers=provider["headers"], json=payload) as response:
+            response.raise_for_status()
+            data = await response.json()
+        if not data.get("choices") or not data["choices"][0].get("message") or not data["choices"][0]["message"].get("content"):
+            self.logger.warning("Respuesta DeepSeek inválida o vacía: %s", data)
+            return "[Respuesta inválida o vacía]"
+        return data["choices"][0]["message"]["content"]
+
+    async def _aquery_gemini(self, prompt: str) -> str:
+        """Variante no bloqueante de _query_gemini (generate_content_async del SDK)."""
+        if not self.providers["gemini"]["model"]:
+            raise RuntimeError("Modelo Gemini no está instanciado correctamente.")
+        gen_config = self.providers["gemini"].get("gen_config_obj") or self.providers["gemini"]["generation_config"]
+        response = await self.providers["gemini"]["model"].generate_content_async(
+            prompt,
+            generation_config=gen_config
+        )
+        if not response.parts:
+            safety_feedback = response.prompt_feedback if hasattr(response, 'prompt_feedback') else 'No feedback'
+            self.logger.warning("Respuesta Gemini vacía. Posible bloqueo. Feedback: %s", safety_feedback)
+            return "[Respuesta bloqueada por seguridad o vacía]"
+        return response.text
+
+    async def _aquery_openai(self, prompt: str) -> str:
+        """Variante no bloqueante de _query_openai usando openai.AsyncOpenAI."""
+        provider = self.providers["openai"]
+        if not provider.get("async_client"):
+            raise RuntimeError("Cliente OpenAI async no inicializado.")
+        response = await provider["async_client"].chat.completions.create(
+            model=provider["model"],
+            messages=[{"role": "user", "content": prompt}],
+            temperature=provider["params"]["temperature"],
+            max_tokens=provider["params"]["max_tokens"]
+        )
+        if not response.choices or not response.choices[0].message or not response.choices[0].message.content:
+            self.logger.warning("Respuesta OpenAI inválida o vacía: %s", response)
+            finish_reason = response.choices[0].finish_reason if response.choices else 'unknown'
+            if finish_reason == 'content_filter':
+                return "[Respuesta bloqueada por filtro de contenido]"
+            return "[Respuesta inválida o vacía]"
+        return response.choices[0].message.content
+
 
     def _query_gemini(self, prompt: str) -> str:
         # (Sin cambios aquí, pero asegúrate que usa self.providers["gemini"]["model"] que es la instancia)
         if not self.providers["gemini"]["model"]:
              raise RuntimeError("Modelo Gemini no está instanciado correctamente.")
+        # Preferir el objeto precompilado en _configure_gemini; el dict queda como fallback
+        gen_config = self.providers["gemini"].get("gen_config_obj") or self.providers["gemini"]["generation_config"]
         try:
             response = self.providers["gemini"]["model"].generate_content(
                 prompt,
-                generation_config=self.providers["gemini"]["generation_config"] # Usa el config guardado
+                generation_config=gen_config
                 # Opcional: request_options={"timeout": self.timeout} si la librería lo soporta bien
             )
             # Añadir validación de respuesta (bloqueos, etc.)
             if not response.parts:
                  # Podría ser un bloqueo de seguridad u otro problema
                  safety_feedback = response.prompt_feedback if hasattr(response, 'prompt_feedback') else 'No feedback'
-                 self.logger.warning(f"Respuesta Gemini vacía. Posible bloqueo. Feedback: {safety_feedback}")
+                 self.logger.warning("Respuesta Gemini vacía. Posible bloqueo. Feedback: %s", safety_feedback)
                  # Devolver un mensaje de error o string vacío controlado
                  return "[Respuesta bloqueada por seguridad o vacía]" 
             return response.text
         except Exception as e:
-            self.logger.error(f"Error específico en _query_gemini: {str(e)}", exc_info=False)
+            self.logger.error("Error específico en _query_gemini: %s", str(e), exc_info=False)
             raise # Re-lanza para que el bucle de reintento lo capture
 
     def _query_deepseek(self, prompt: str) -> str:
-        # (Sin cambios aquí)
+        # Serialización con orjson: más rápida que el json de stdlib en payloads grandes
+        # (el header Content-Type: application/json ya está en provider["headers"])
         provider = self.providers["deepseek"]
-        payload = {**provider["payload_template"], "messages": [{"role": "user", "content": prompt}]}
-        response = requests.post( provider["endpoint"], headers=provider["headers"], json=payload, timeout=self.timeout )
+        payload = dict(self._deepseek_payload_base)
+        payload["messages"] = [{"role": "user", "content": prompt}]
+        response = self._http.post( provider["endpoint"], headers=provider["headers"], data=orjson.dumps(payload), timeout=self.timeout )
         response.raise_for_status() # Lanza excepción para errores HTTP
-        data = response.json()
+        data = orjson.loads(response.content)
         # Añadir validación de contenido
         if not data.get("choices") or not data["choices"][0].get("message") or not data["choices"][0]["message"].get("content"):
-             self.logger.warning(f"Respuesta DeepSeek inválida o vacía: {data}")
+             self.logger.warning("Respuesta DeepSeek inválida o vacía: %s", data)
              return "[Respuesta inválida o vacía]"
         return data["choices"][0]["message"]["content"]
 
@@ -292,25 +1086,25 @@ class HybridAIConnector:
             )
              # Añadir validación
             if not response.choices or not response.choices[0].message or not response.choices[0].message.content:
-                 self.logger.warning(f"Respuesta OpenAI inválida o vacía: {response}")
+                 self.logger.warning("Respuesta OpenAI inválida o vacía: %s", response)
                  # Chequear 'finish_reason' si es por 'content_filter'
                  finish_reason = response.choices[0].finish_reason if response.choices else 'unknown'
                  if finish_reason == 'content_filter':
                       return "[Respuesta bloqueada por filtro de contenido]"
                  return "[Respuesta inválida o vacía]"
             return response.choices[0].message.content
-        except openai.APIConnectionError as e:
-             self.logger.error(f"Error de Conexión OpenAI: {e}")
+        except self._openai.APIConnectionError as e:
+             self.logger.error("Error de Conexión OpenAI: %s", e)
              raise requests.exceptions.RequestException(f"OpenAI Connection Error: {e}") # Re-lanzar como error de red
-        except openai.RateLimitError as e:
-             self.logger.error(f"Error de Límite de Tasa OpenAI: {e}")
+        except self._openai.RateLimitError as e:
+             self.logger.error("Error de Límite de Tasa OpenAI: %s", e)
              # Podrías manejar esto esperando un poco antes de reintentar, pero por ahora, lo dejamos fallar
              raise # Re-lanza para que el bucle lo capture como error del proveedor
-        except openai.APIStatusError as e:
-             self.logger.error(f"Error de Estado API OpenAI (HTTP {e.status_code}): {e.response}")
+        except self._openai.APIStatusError as e:
+             self.logger.error("Error de Estado API OpenAI (HTTP %s): %s", e.status_code, e.response)
              raise # Re-lanza
         except Exception as e:
-             self.logger.error(f"Error inesperado en _query_openai: {str(e)}", exc_info=False)
+             self.logger.error("Error inesperado en _query_openai: %s", str(e), exc_info=False)
              raise # Re-lanza
 
 
@@ -318,11 +1112,11 @@ class HybridAIConnector:
         # (Sin cambios aquí)
         # Podrías añadir aquí una generación simple basada en random.choice si quieres
         # return f"[Error API: {error}. No se pudo generar contenido para: {prompt[:50]}...]"
-         return json.dumps({
+         return orjson.dumps({
             "error": str(error), "message": "No se pudo completar la solicitud API",
             "original_prompt": prompt[:100]+"...",
             "suggested_actions": ["Verificar conexión", "Validar claves API (.env)", "Revisar logs de error"]
-        }, ensure_ascii=False, indent=2)
+        }, option=orjson.OPT_INDENT_2).decode()
 
 
     def get_active_providers(self) -> list:
@@ -36,19 +36,27 @@ Setup:
 """
 
 import tkinter as tk
-from tkinter import scrolledtext, messagebox, PhotoImage, simpledialog
+from tkinter import messagebox, PhotoImage, simpledialog
 import tkinter.ttk as ttk # Usar themed widgets
+import tkinter.font as tkfont # Fuentes nombradas (creadas una vez, ver sección GUI)
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+import collections
+import gzip
+import hashlib
+import itertools
 import random
 import time
 import os
 import json
 import re
+import sqlite3
 import threading
-import queue
 
 # Importar el conector de API personalizado
 try:
-    from api_connectors import HybridAIConnector
+    from api_connectors import HybridAIConnector, StreamInterrupted
 except ImportError:
     # Mostrar error si el archivo del conector no se encuentra
     root = tk.Tk()
@@ -65,52 +73,237 @@ except Exception as e:
 
 # --- Constantes y Configuración ---
 SAVE_FILE = "rpg_save.json" # Nombre del archivo de guardado
+# Regex de tags del DM ([DAÑO: X], [CURA: Y], etc.), compilada una sola vez al
+# importar en lugar de en cada respuesta (case-insensitive para el nombre del tag)
+TAG_RE = re.compile(r"\[(DAÑO|CURA|XP|ITEM):\s*([^\]]+)\]", re.IGNORECASE)
+# Opciones numeradas '[1] Texto' en las respuestas del DM (ver iter_options)
+OPTION_RE = re.compile(r"\[(\d+)\]\s*([^\[\n]+)")
+CONTEXT_MAXLEN = 25 # Máximo de intercambios recordados (coincide con lo que se guarda)
+CONTEXT_ENTRY_MAXCHARS = 400 # Recorte por entrada del historial (respuestas largas del DM)
+CONTEXT_STR_MAXCHARS = 2000 # Tope del bloque de contexto dentro del prompt
+
+# Tuplas de tags por tipo de línea, como constantes de módulo: cada inserción
+# reutiliza la misma tupla en vez de construir una nueva por llamada
+PLAYER_TAGS = ("player_tag", "bold")
+DM_PREFIX_TAGS = ("dm_tag", "bold")
+DM_TEXT_TAGS = ("dm_text",)
+ROLL_TAGS = ("roll_tag", "italic")
+SYSTEM_TAGS = ("system_tag", "italic", "grey")
+LEVELUP_TAGS = ("levelup_tag", "bold", "gold")
+
+# Tope de líneas del log: Tk Text se degrada mucho con miles de líneas taggeadas,
+# así que el widget se comporta como ring-buffer (las más viejas se borran).
+# El margen evita pagar un delete en cada inserción.
+LOG_MAX_LINES = 2000
+LOG_TRIM_SLACK = 200
+
+# Instrucciones fijas del DM, como constante de módulo y SIEMPRE al principio del
+# prompt: los proveedores cachean prefijos estables entre llamadas, así que mover
+# la parte que nunca cambia al frente (y el estado dinámico al final) abarata y
+# acelera cada petición. No editar por-llamada; lo dinámico va en ask_dm_ai.
+DM_SYSTEM_PROMPT = (
+    "Eres el Dungeon Master (DM) de un juego de rol de texto estilo D&D simplificado.\n"
+    "Instrucciones para el DM:\n"
+    "1. Narra el resultado de la acción del jugador de forma interesante y coherente.\n"
+    "2. Describe la situación actual.\n"
+    "3. **IMPORTANTE:** Si el jugador recibe daño o se cura, indícalo CLARAMENTE usando los tags [DAÑO: X] o [CURA: Y] (ej: 'El goblin te golpea! [DAÑO: 4]').\n"
+    "4. **IMPORTANTE:** Si el jugador supera un desafío o logra algo significativo, otórgale experiencia usando el tag [XP: Z] (ej: 'Logras descifrar el enigma. [XP: 50]'). Otorga XP con moderación.\n"
+    "5. **IMPORTANTE:** Si el jugador encuentra un objeto, indícalo con el tag [ITEM: Nombre del Objeto] (ej: 'Encuentras una [ITEM: Daga brillante] en el cofre.')\n"
+    "6. Termina tu respuesta preguntando '¿Qué haces?' o con 2-3 opciones numeradas [1] Opción A [2] Opción B.\n"
+    "7. Mantén las respuestas relativamente cortas (2-6 frases).\n"
+    "8. Si HP llega a 0 o menos, narra la derrota épica.\n"
+    "9. Sé creativo y mantén el espíritu de D&D."
+)
 
 # --- Estado del Juego (Valores por defecto para juego nuevo) ---
-DEFAULT_PLAYER_STATS = {
-    "HP": 15, "MaxHP": 15, "STR": 10, "DEX": 10,
-    "Level": 1, "XP": 0, "XP_Next_Level": 100,
-    "Notas": "Un aventurero novato."
-}
-player_stats = DEFAULT_PLAYER_STATS.copy() # Estado actual del jugador
-player_inventory = [] # Inventario actual
-game_context = ["Inicio de la Aventura"] # Historial reciente para la IA
+@dataclass(slots=True)
+class PlayerStats:
+    """
+    Estado del personaje. Dataclass con slots=True: acceso a atributos más
+    rápido y menos memoria que un dict, y los typos de campo fallan alto
+    (AttributeError) en vez de crear claves silenciosas.
+    """
+    HP: int = 15
+    MaxHP: int = 15
+    STR: int = 10
+    DEX: int = 10
+    Level: int = 1
+    XP: int = 0
+    XP_Next_Level: int = 100
+    Notas: str = "Un aventurero novato."
+
+    def to_dict(self):
+        """Convierte a dict plano para el guardado JSON."""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Reconstruye desde un guardado, ignorando claves desconocidas (saves viejos)."""
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+player_stats = PlayerStats() # Estado actual del jugador
+# Inventario como Counter por nombre canónico (minúsculas): apilar 5 pociones son
+# una entrada con cuenta 5, y buscar/consumir deja de ser un escaneo de lista.
+# item_display_names conserva la grafía original del DM para mostrarla al jugador.
+player_inventory = collections.Counter()
+item_display_names = {}
+# Historial reciente para la IA: deque acotada, descarta sola las entradas viejas
+# (antes la lista crecía sin límite durante toda la sesión y solo se recortaba al guardar)
+game_context = collections.deque(["Inicio de la Aventura"], maxlen=CONTEXT_MAXLEN)
 game_over = False # Flag para saber si el juego terminó
 
 # --- Variables Globales ---
 connector = None # Instancia del conector API
 connector_status = "OFFLINE (Inicializando...)" # Estado visible de la API
 window = None # Ventana principal de Tkinter
-log_area = None # Widget ScrolledText para mostrar el juego
+log_area = None # Widget tk.Text para mostrar el juego
 # Labels para mostrar estado
 hp_label = None
 stats_label = None
 xp_label = None
 connector_label = None
+# StringVars asociadas a los labels (se crean con la GUI): actualizar estado es
+# un .set() sobre la variable, Tk repinta solo el label afectado
+hp_var = None
+stats_var = None
+xp_var = None
+connector_var = None
 # Widgets de entrada
 input_entry = None
 send_button = None
-# Cola para comunicación entre hilos y GUI
-gui_queue = queue.Queue()
+# Flag de vida de la GUI: True hasta que on_closing decide cerrar. Sustituye
+# el sondeo de window.winfo_exists() en los caminos calientes (cada llamada es
+# un viaje de ida y vuelta al intérprete Tcl); los try/except TclError quedan
+# como red de seguridad para carreras durante el propio cierre.
+_alive = True
+
+# Cola para comunicación entre hilos y GUI. deque en vez de queue.Queue: el
+# único consumidor es el hilo de Tk y drena por sondeo (nunca bloquea), así que
+# los locks/conditions de queue.Queue son puro costo. append/popleft de deque
+# son atómicos bajo el GIL, suficiente para este patrón productor-consumidor.
+gui_queue = collections.deque()
+
+# --- Helpers de productor para la cola de logs ---
+# Los hilos de fondo deben usar estos helpers en vez de armar tuplas a mano:
+# una ráfaga de líneas (p.ej. al cargar partida) viaja como UN solo mensaje
+# "process_log_batch", y el consumidor paga un único ciclo NORMAL/insertar/
+# see(END)/DISABLED por ráfaga en vez de uno por línea.
+def queue_log(msg, tag=None):
+    """Encola una línea de log suelta para la GUI (hilo-seguro)."""
+    gui_queue.append(("add_log", (msg, tag)))
+
+def queue_log_batch(entries):
+    """Encola una ráfaga de líneas [(msg, tag), ...] como un único lote."""
+    if entries:
+        gui_queue.append(("process_log_batch", [("add_log", e) for e in entries]))
+# Memo del lado del juego para respuestas del DM: prompts completos idénticos
+# (misma escena + misma acción) se resuelven sin tocar siquiera el conector.
+# Clave: hash blake2b del prompt completo normalizado (no se retienen prompts en RAM).
+dm_response_cache = {}
+
+# --- Cache DM persistente (SQLite) ---
+# Respaldo en disco del memo anterior: reiniciar el juego no pierde las
+# respuestas ya pagadas. Todas las escrituras ocurren en el hilo del loop DM,
+# así que la conexión no necesita lock propio.
+DM_CACHE_FILE = "dm_cache.db"
+
+def _dm_cache_key(full_prompt):
+    """Clave de cache: hash del prompt normalizado (minúsculas, espacios colapsados)."""
+    normalized = " ".join(full_prompt.lower().split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+def _open_dm_cache():
+    """Abre (o crea) la base SQLite del cache DM. Devuelve None si falla."""
+    try:
+        conn = sqlite3.connect(DM_CACHE_FILE, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS dm_cache ("
+                     " key BLOB PRIMARY KEY, response TEXT NOT NULL, ts REAL NOT NULL)")
+        conn.commit()
+        return conn
+    except Exception as e:
+        print(f"Cache DM en disco deshabilitado: {e}")
+        return None
+
+dm_cache_db = _open_dm_cache()
+
+def _dm_cache_store(key, response_text):
+    """Escribe una respuesta en el cache en disco (best-effort)."""
+    if dm_cache_db is None: return
+    try:
+        dm_cache_db.execute("INSERT OR REPLACE INTO dm_cache (key, response, ts) VALUES (?, ?, ?)",
+                            (key, response_text, time.time()))
+        dm_cache_db.commit()
+    except Exception:
+        pass # El cache en disco nunca debe tumbar una partida
+
+def _warm_dm_cache(limit=256):
+    """Precarga en RAM las entradas más recientes del cache en disco."""
+    if dm_cache_db is None: return
+    try:
+        rows = dm_cache_db.execute(
+            "SELECT key, response FROM dm_cache ORDER BY ts DESC LIMIT ?", (limit,)).fetchall()
+        for key, response in rows:
+            dm_response_cache.setdefault(key, response)
+    except Exception:
+        pass
+
+_warm_dm_cache()
+
+# Event loop asyncio en un hilo de fondo dedicado para las llamadas al DM:
+# un único hilo persistente en lugar de crear uno nuevo por petición, y da
+# acceso a la ruta async del conector (aquery/aiohttp con sesión keep-alive).
+dm_loop = asyncio.new_event_loop()
+
+# Pool de hilos de fondo compartido: un único worker reutilizado para todo el
+# trabajo bloqueante (inicialización del conector, el generador síncrono de
+# streaming vía asyncio.to_thread) en vez de crear un Thread por tarea. Un solo
+# worker serializa de forma natural (el juego es por turnos) y da un punto de
+# cancelación limpio al cerrar. Las llamadas al DM propiamente dichas siguen en
+# el loop asyncio de arriba (aquery/aiohttp), que ya evita hilos por completo.
+DM_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dm")
+# to_thread/run_in_executor(None, ...) del loop DM usan este mismo pool
+dm_loop.set_default_executor(DM_POOL)
+
+def _run_dm_loop():
+    """Cuerpo del hilo del loop DM (corre hasta que on_closing lo detiene)."""
+    asyncio.set_event_loop(dm_loop)
+    dm_loop.run_forever()
+
+threading.Thread(target=_run_dm_loop, daemon=True, name="dm-loop").start()
+
+# Opciones numeradas ofrecidas en la última respuesta del DM ({"1": texto, ...});
+# permite expandir una respuesta "1" del jugador al texto real de la opción.
+last_options = {}
+# Máximo de ramas especuladas en vuelo a la vez (no saturar cuota de API)
+_speculation_limit = asyncio.Semaphore(2)
+# Señal de cancelación del streaming en curso (/stop o tecla Escape)
+stream_stop_event = threading.Event()
+# Señal de apagado cooperativo: on_closing la activa antes de destruir la
+# ventana y los trabajadores de fondo la consultan entre pasos, en vez de
+# confiar en que los hilos daemon mueran con el intérprete.
+SHUTDOWN = threading.Event()
 
 # --- DEFINICIÓN DE FUNCIONES ---
 
 def run_in_thread(target_func, *args, **kwargs):
     """
-    Ejecuta una función objetivo en un hilo separado (daemon).
+    Ejecuta una función objetivo en el pool de fondo compartido (DM_POOL).
 
     Args:
-        target_func: La función a ejecutar en el hilo.
+        target_func: La función a ejecutar en el pool.
         *args: Argumentos posicionales para target_func.
         **kwargs: Argumentos clave para target_func.
+
+    Returns:
+        concurrent.futures.Future del trabajo enviado.
     """
-    thread = threading.Thread(target=target_func, args=args, kwargs=kwargs)
-    thread.daemon = True # Permite que el programa termine aunque el hilo siga activo
-    thread.start()
+    return DM_POOL.submit(target_func, *args, **kwargs)
 
 def add_log(message, tag=None):
     """
-    Añade un mensaje al área de log principal (ScrolledText) de forma segura.
+    Añade un mensaje al área de log principal (tk.Text) de forma segura.
     Debe ser llamado desde el hilo principal o poniendo el mensaje en la gui_queue.
 
     Args:
@@ -120,17 +313,13 @@ def add_log(message, tag=None):
     """
     try:
         # Asegurarse que la ventana y el widget existen antes de interactuar
-        if window and window.winfo_exists() and log_area:
+        if _alive and window and log_area:
+            if not _log_at_bottom(): # Jugador releyendo: diferir, no robar la vista
+                _pending_log_entries.append((message, tag))
+                return
             log_area.config(state=tk.NORMAL) # Habilitar escritura
-
-            # Aplicar formato basado en tags
-            if tag == "player": log_area.insert(tk.END, "Tú: ", ("player_tag", "bold")); log_area.insert(tk.END, message + "\n")
-            elif tag == "dm": log_area.insert(tk.END, "DM: ", ("dm_tag", "bold")); log_area.insert(tk.END, message + "\n\n", ("dm_text"))
-            elif tag == "roll": log_area.insert(tk.END, message + "\n", ("roll_tag", "italic"))
-            elif tag == "system": log_area.insert(tk.END, message + "\n", ("system_tag", "italic", "grey"))
-            elif tag == "levelup": log_area.insert(tk.END, message + "\n", ("levelup_tag", "bold", "gold"))
-            else: log_area.insert(tk.END, message + "\n") # Sin tag especial
-
+            _insert_log_line(message, tag)
+            _trim_log_area() # Mantener el widget acotado (dentro del mismo ciclo)
             log_area.see(tk.END) # Hacer scroll automático hacia el final
             log_area.config(state=tk.DISABLED) # Deshabilitar escritura
     except tk.TclError:
@@ -139,23 +328,207 @@ def add_log(message, tag=None):
         # Fallback si la GUI no está completamente lista (improbable con queue)
         print(f"Log ({tag or 'System'}): {message}")
 
+# Registro perezoso de tags del Text: cada tag_config crea un registro de
+# estilo en el lado Tcl, así que solo se registra un tag la primera vez que
+# una línea lo usa (muchas partidas nunca muestran p.ej. levelup_tag).
+# TAG_SPECS se define en la sección de GUI (necesita las fuentes ya creadas).
+_registered_tags = set()
+
+def _ensure_tags(tag_names):
+    """Registra en log_area los tags de la tupla que aún no existan."""
+    for name in tag_names:
+        if name not in _registered_tags:
+            _registered_tags.add(name)
+            spec = TAG_SPECS.get(name)
+            if spec:
+                try:
+                    log_area.tag_config(name, **spec)
+                except tk.TclError:
+                    pass # Mejor un tag sin estilo que romper la inserción
+
+def _insert_log_line(message, tag=None):
+    """Inserta una línea formateada en log_area (asume que ya está en estado NORMAL)."""
+    # Aplicar formato basado en tags. Las líneas con prefijo usan UNA llamada a
+    # insert con pares (texto, tags) alternados: un solo viaje a Tcl y un solo
+    # re-layout del widget en vez de dos.
+    if tag == "player": _ensure_tags(PLAYER_TAGS); log_area.insert(tk.END, "Tú: ", PLAYER_TAGS, message + "\n", ())
+    elif tag == "dm": _ensure_tags(DM_PREFIX_TAGS); _ensure_tags(DM_TEXT_TAGS); log_area.insert(tk.END, "DM: ", DM_PREFIX_TAGS, message + "\n\n", DM_TEXT_TAGS)
+    elif tag == "roll": _ensure_tags(ROLL_TAGS); log_area.insert(tk.END, message + "\n", ROLL_TAGS)
+    elif tag == "system": _ensure_tags(SYSTEM_TAGS); log_area.insert(tk.END, message + "\n", SYSTEM_TAGS)
+    elif tag == "levelup": _ensure_tags(LEVELUP_TAGS); log_area.insert(tk.END, message + "\n", LEVELUP_TAGS)
+    else: log_area.insert(tk.END, message + "\n") # Sin tag especial
+
+def _batch_insert_args(entries):
+    """
+    Aplana un lote [(mensaje, tag), ...] en pares (texto, tags) alternados para
+    UNA única llamada a insert. Los trozos consecutivos con los mismos tags se
+    fusionan con join implícito: el costo dominante de mutar un Text de Tk es
+    la transición Python→Tcl, y así todo el lote paga exactamente una.
+    """
+    texts = [] # Trozos de texto a insertar, en orden
+    tag_runs = [] # Tupla de tags de cada trozo (paralela a texts)
+
+    def emit(chunk, chunk_tags):
+        if tag_runs and tag_runs[-1] == chunk_tags:
+            texts[-1] += chunk # Mismo formato que el trozo anterior: fusionar
+        else:
+            _ensure_tags(chunk_tags)
+            texts.append(chunk)
+            tag_runs.append(chunk_tags)
+
+    for message, tag in entries:
+        if tag == "player":
+            emit("Tú: ", PLAYER_TAGS); emit(message + "\n", ())
+        elif tag == "dm":
+            emit("DM: ", DM_PREFIX_TAGS); emit(message + "\n\n", DM_TEXT_TAGS)
+        elif tag == "roll": emit(message + "\n", ROLL_TAGS)
+        elif tag == "system": emit(message + "\n", SYSTEM_TAGS)
+        elif tag == "levelup": emit(message + "\n", LEVELUP_TAGS)
+        else: emit(message + "\n", ())
+
+    args = []
+    for chunk, chunk_tags in zip(texts, tag_runs):
+        args.append(chunk)
+        args.append(chunk_tags)
+    return args
+
+def _trim_log_area():
+    """Recorta las líneas más viejas si el log supera el tope (asume estado NORMAL)."""
+    total_lines = int(log_area.index('end-1c').split('.')[0])
+    if total_lines > LOG_MAX_LINES + LOG_TRIM_SLACK:
+        log_area.delete('1.0', f'{total_lines - LOG_MAX_LINES}.0')
+
+# --- Modo lectura del log (jugador scrolleado hacia arriba) ---
+# Insertar y taggear líneas que el jugador ni siquiera ve es trabajo de render
+# desperdiciado, y el see(END) automático le "roba" la vista mientras relee.
+# Si el viewport no está pegado al final, las líneas nuevas se acumulan aquí y
+# se insertan en UNA sola ráfaga cuando vuelve abajo (el bombeo de la cola GUI
+# lo comprueba en cada ciclo). Mientras tanto no se toca el widget en absoluto.
+_pending_log_entries = []
+_LOG_BOTTOM_EPS = 0.001
+# Mantenido por _on_yscroll (el yscrollcommand del log): consultar el flag es
+# gratis, frente al viaje a Tcl que costaría log_area.yview() en cada inserción
+_log_view_at_bottom = True
+
+def _on_yscroll(first, last):
+    """yscrollcommand del log: refresca la scrollbar y el flag de viewport."""
+    global _log_view_at_bottom
+    _log_view_at_bottom = float(last) >= 1.0 - _LOG_BOTTOM_EPS
+    log_scroll.set(first, last)
+
+def _log_at_bottom():
+    """True si el viewport del log está (prácticamente) pegado al final."""
+    return _log_view_at_bottom
+
+def _flush_pending_log():
+    """Vuelca las líneas diferidas si el jugador ya volvió al final del log."""
+    global _pending_log_entries
+    if _pending_log_entries and _log_at_bottom():
+        pending, _pending_log_entries = _pending_log_entries, []
+        add_log_batch(pending)
+
+def add_log_batch(entries):
+    """
+    Añade varias líneas al log con un ÚNICO ciclo NORMAL → inserts → see → DISABLED.
+    Mucho más barato que llamar a add_log por cada línea (evita reconfigurar el
+    widget y hacer scroll una vez por entrada, p.ej. al volcar el contexto cargado).
+
+    Args:
+        entries (list): Lista de tuplas (mensaje, tag).
+    """
+    try:
+        if _alive and window and log_area:
+            if not _log_at_bottom(): # Jugador releyendo: diferir todo el lote
+                _pending_log_entries.extend(entries)
+                return
+            log_area.config(state=tk.NORMAL)
+            args = _batch_insert_args(entries)
+            if args:
+                log_area.insert(tk.END, *args) # Todo el lote en una llamada
+            _trim_log_area() # Un solo recorte por lote, dentro del mismo ciclo
+            log_area.see(tk.END) # Un solo scroll al final del lote
+            log_area.config(state=tk.DISABLED)
+    except tk.TclError:
+        pass
+    except AttributeError:
+        for message, tag in entries:
+            print(f"Log ({tag or 'System'}): {message}")
+
+# Flag de "estado sucio" para colapsar actualizaciones de labels consecutivas
+_status_dirty = False
+
+def _stream_insert(text, tags=DM_TEXT_TAGS):
+    """Inserta un fragmento de stream en el log sin salto de línea (hilo principal)."""
+    global _pending_log_entries
+    try:
+        if _alive and window and log_area:
+            at_bottom = _log_at_bottom()
+            if _pending_log_entries: # Preservar el orden: primero lo diferido
+                pending, _pending_log_entries = _pending_log_entries, []
+                log_area.config(state=tk.NORMAL)
+                log_area.insert(tk.END, *_batch_insert_args(pending))
+                log_area.config(state=tk.DISABLED)
+            log_area.config(state=tk.NORMAL)
+            _ensure_tags(tags)
+            log_area.insert(tk.END, text, tags)
+            if at_bottom: # No robar la vista si el jugador está releyendo
+                log_area.see(tk.END)
+            log_area.config(state=tk.DISABLED)
+    except tk.TclError:
+        pass
+    except AttributeError:
+        print(f"Stream: {text}", end="")
+
 def update_status_display():
-    """Actualiza las etiquetas de estado (HP, Stats, XP, API) en la GUI."""
+    """
+    Solicita actualizar las etiquetas de estado (HP, Stats, XP, API).
+    Varias llamadas seguidas (p.ej. daño + cura + XP en la misma respuesta del DM)
+    se colapsan en un único refresco real agendado con after_idle.
+    """
+    global _status_dirty
+    if _status_dirty:
+        return # Ya hay un refresco agendado
+    _status_dirty = True
     try:
-        if window and window.winfo_exists():
-            # Actualizar cada Label con la información actual de player_stats
-            hp_label.config(text=f"HP: {player_stats.get('HP', '?')}/{player_stats.get('MaxHP', '?')}")
-            other_stats = f"STR: {player_stats.get('STR', '?')} | DEX: {player_stats.get('DEX', '?')}"
-            stats_label.config(text=other_stats)
-            xp_label.config(text=f"Lvl: {player_stats.get('Level', '?')} | XP: {player_stats.get('XP', '?')}/{player_stats.get('XP_Next_Level', '?')}")
-            connector_label.config(text=f"API: {connector_status}")
+        if _alive and window:
+            window.after_idle(_flush_status_display)
+    except tk.TclError: pass
+    except AttributeError: pass # GUI aún no construida
+
+# Plantillas fijas de los labels de estado (compiladas una vez) y los valores
+# crudos que produjeron el último texto de cada uno: si los valores no
+# cambiaron, ni se formatea la cadena ni se toca la StringVar (un texto
+# idéntico igualmente dispararía el recálculo de geometría de Tk).
+_HP_FMT = "HP: %s/%s"
+_STATS_FMT = "STR: %s | DEX: %s"
+_XP_FMT = "Lvl: %s | XP: %s/%s"
+_API_FMT = "API: %s"
+_last_status_vals = {}
+
+def _set_status_var(var, key, fmt, vals):
+    """Formatea y hace var.set() solo si los valores crudos cambiaron."""
+    if _last_status_vals.get(key) != vals:
+        _last_status_vals[key] = vals
+        var.set(fmt % vals)
+
+def _flush_status_display():
+    """Refresco real del estado (siempre en el hilo principal, vía after_idle)."""
+    global _status_dirty
+    _status_dirty = False
+    try:
+        if _alive and window:
+            # Un .set() por StringVar que realmente cambió: Tk solo repinta esos labels
+            _set_status_var(hp_var, "hp", _HP_FMT, (player_stats.HP, player_stats.MaxHP))
+            _set_status_var(stats_var, "stats", _STATS_FMT, (player_stats.STR, player_stats.DEX))
+            _set_status_var(xp_var, "xp", _XP_FMT, (player_stats.Level, player_stats.XP, player_stats.XP_Next_Level))
+            _set_status_var(connector_var, "api", _API_FMT, (connector_status,))
     except tk.TclError: pass
     except AttributeError: pass # Ignorar si los widgets no existen aún
 
 def set_input_state(state):
     """Habilita o deshabilita el campo de entrada y el botón de enviar."""
     try:
-        if window and window.winfo_exists():
+        if _alive and window:
             if input_entry: input_entry.config(state=state)
             if send_button: send_button.config(state=state)
     except tk.TclError: pass
@@ -163,18 +536,21 @@ def set_input_state(state):
 
 def initialize_connector():
     """
-    Inicializa el conector de APIs de forma síncrona.
-    Intenta cargar una partida guardada antes de inicializar.
-    Pone tareas en la cola para actualizar la GUI y empezar el juego.
+    Inicializa el conector de APIs (pensado para correr en un hilo de fondo,
+    tras el primer pintado de la ventana). Intenta cargar una partida guardada
+    antes de inicializar y pone tareas en la cola para actualizar la GUI y
+    empezar el juego.
     """
     global connector, connector_status
 
+    if SHUTDOWN.is_set(): return # La app se cerró antes de llegar aquí
+
     # Intentar cargar partida guardada primero
-    gui_queue.put(("log", "Intentando cargar partida guardada..."))
+    queue_log("Intentando cargar partida guardada...")
     load_game() # Esta función pondrá logs en la cola sobre el resultado
 
     # Inicializar el conector
-    gui_queue.put(("log", "Inicializando conector IA (puede tardar)..."))
+    queue_log("Inicializando conector IA (puede tardar)...")
     connector_status = "OFFLINE (Inicializando...)" # Estado inicial
 
     try:
@@ -192,98 +568,309 @@ def initialize_connector():
         # Error durante la inicialización del conector
         connector = None
         connector_status = f"OFFLINE (Error: {e})"
-        gui_queue.put(("log", f"ERROR grave inicializando conector: {e}"))
+        queue_log(f"ERROR grave inicializando conector: {e}")
 
     # Informar estado final y pedir actualización de GUI
-    gui_queue.put(("log", f"Estado final del conector: {connector_status}"))
-    gui_queue.put(("update_status", None)) # Tarea para actualizar labels
+    queue_log(f"Estado final del conector: {connector_status}")
+    gui_queue.append(("update_status", None)) # Tarea para actualizar labels
 
     # Si no se cargó una partida terminada y el contexto está vacío (nuevo juego), empezar
     if not game_over and len(game_context) <= 1:
-         gui_queue.put(("start_game", None)) # Tarea para generar escena inicial
+         gui_queue.append(("start_game", None)) # Tarea para generar escena inicial
     elif not game_over: # Si se cargó partida y no está terminada
-         gui_queue.put(("log", "Partida cargada reanudada."))
-         gui_queue.put(("set_input_state", tk.NORMAL)) # Habilitar input
+         queue_log("Partida cargada reanudada.")
+         gui_queue.append(("set_input_state", tk.NORMAL)) # Habilitar input
     else: # Si se cargó partida terminada
-        gui_queue.put(("set_input_state", tk.DISABLED))
+        gui_queue.append(("set_input_state", tk.DISABLED))
 
 
-def ask_dm_ai(prompt: str, callback):
+# Seguimiento de cambios para el guardado: versión del estado vs. versión ya
+# escrita en disco. save_game se salta la serialización completa (stats +
+# inventario + contexto + gzip) cuando nada cambió desde el último guardado.
+_state_version = 0
+_saved_version = -1
+
+def mark_state_dirty():
+    """Señala que el estado del juego cambió desde el último guardado."""
+    global _state_version
+    _state_version += 1
+
+def push_context(entry):
+    """
+    Añade una entrada al historial truncándola a CONTEXT_ENTRY_MAXCHARS: cada
+    carácter del contexto se paga en tokens en TODAS las llamadas siguientes,
+    así que una respuesta larguísima del DM no debe inflar el prompt para siempre.
+    """
+    if len(entry) > CONTEXT_ENTRY_MAXCHARS:
+        entry = entry[:CONTEXT_ENTRY_MAXCHARS] + "…"
+    game_context.append(entry)
+    mark_state_dirty()
+
+def iter_options(text):
+    """
+    Genera tuplas (número, texto) por cada opción numerada '[N] ...' de una
+    respuesta del DM, ya limpias (sin espacios ni punto final). Generador: el
+    caller puede quedarse con las primeras N sin escanear el resto del texto.
     """
-    Envía una petición a la IA (actuando como DM) en un hilo secundario.
-    Construye un prompt detallado con contexto, stats e instrucciones.
-    Pone la tupla (callback, resultado) en la gui_queue al terminar.
+    for match in OPTION_RE.finditer(text):
+        option_text = match.group(2).strip().rstrip('.')
+        if option_text:
+            yield match.group(1), option_text
+
+def format_inventory():
+    """Representación compacta del inventario ('Poción x2, Daga') para prompts y logs."""
+    if not player_inventory:
+        return "Vacío"
+    parts = []
+    for canonical, count in sorted(player_inventory.items()):
+        name = item_display_names.get(canonical, canonical)
+        parts.append(f"{name} x{count}" if count > 1 else name)
+    return ", ".join(parts)
+
+def build_dm_prompt(task_prompt, context_entries):
+    """
+    Construye el prompt completo del DM: prefijo estable (instrucciones) primero,
+    estado dinámico al final. Compartido entre la petición real y el prefetch
+    especulativo para que ambos generen prompts byte-a-byte idénticos (y por
+    tanto la misma clave de cache).
 
     Args:
-        prompt (str): La TAREA ACTUAL o acción del jugador a procesar por la IA.
-        callback (callable): La función a llamar (en el hilo principal) cuando se recibe la respuesta.
+        task_prompt (str): La tarea/acción actual a procesar por la IA.
+        context_entries (list): Entradas de contexto reciente ya recortadas.
     """
-    # Feedback visual inmediato en la GUI
-    add_log("... DM está pensando ...", "italic")
+    context_str = "\n".join(context_entries)
+    if len(context_str) > CONTEXT_STR_MAXCHARS:
+        context_str = context_str[-CONTEXT_STR_MAXCHARS:] # Conservar lo más reciente
+    inventory_str = format_inventory()
+    if len(inventory_str) > 150: inventory_str = inventory_str[:150] + "..."
+    return (
+        f"{DM_SYSTEM_PROMPT}\n\n"
+        f"Contexto Reciente:\n{context_str}\n\n"
+        f"Estadísticas del Jugador: Lvl={player_stats.Level}, HP={player_stats.HP}/{player_stats.MaxHP}, STR={player_stats.STR}, DEX={player_stats.DEX}, XP={player_stats.XP}/{player_stats.XP_Next_Level}\n"
+        f"Inventario: {inventory_str}\n"
+        f"Notas del Jugador: {player_stats.Notas}\n\n"
+        f"TAREA ACTUAL: {task_prompt}"
+    )
 
-    def generation_task():
-        """Tarea ejecutada en el hilo secundario para llamar a la API."""
-        result = None
-        status = "offline"
-        if connector:
-            # Construir contexto y prompt completo
-            context_str = "\n".join(game_context[-6:]) # Usar historial reciente
-            inventory_str = ", ".join(player_inventory) if player_inventory else "Vacío"
-            if len(inventory_str) > 150: inventory_str = inventory_str[:150] + "..."
-
-            # Prompt detallado con instrucciones claras para la IA/DM
-            full_prompt = (
-                f"Eres el Dungeon Master (DM) de un juego de rol de texto estilo D&D simplificado.\n"
-                f"Contexto Reciente:\n{context_str}\n\n"
-                f"Estadísticas del Jugador: Lvl={player_stats.get('Level',1)}, HP={player_stats.get('HP',1)}/{player_stats.get('MaxHP',1)}, STR={player_stats.get('STR',10)}, DEX={player_stats.get('DEX',10)}, XP={player_stats.get('XP',0)}/{player_stats.get('XP_Next_Level',100)}\n"
-                f"Inventario: {inventory_str}\n"
-                f"Notas del Jugador: {player_stats.get('Notas', 'N/A')}\n\n"
-                f"TAREA ACTUAL: {prompt}\n\n"
-                f"Instrucciones para el DM:\n"
-                f"1. Narra el resultado de la acción del jugador de forma interesante y coherente.\n"
-                f"2. Describe la situación actual.\n"
-                f"3. **IMPORTANTE:** Si el jugador recibe daño o se cura, indícalo CLARAMENTE usando los tags [DAÑO: X] o [CURA: Y] (ej: 'El goblin te golpea! [DAÑO: 4]').\n"
-                f"4. **IMPORTANTE:** Si el jugador supera un desafío o logra algo significativo, otórgale experiencia usando el tag [XP: Z] (ej: 'Logras descifrar el enigma. [XP: 50]'). Otorga XP con moderación.\n"
-                f"5. **IMPORTANTE:** Si el jugador encuentra un objeto, indícalo con el tag [ITEM: Nombre del Objeto] (ej: 'Encuentras una [ITEM: Daga brillante] en el cofre.')\n"
-                f"6. Termina tu respuesta preguntando '¿Qué haces?' o con 2-3 opciones numeradas [1] Opción A [2] Opción B.\n"
-                f"7. Mantén las respuestas relativamente cortas (2-6 frases).\n"
-                f"8. Si HP llega a 0 o menos, narra la derrota épica.\n"
-                f"9. Sé creativo y mantén el espíritu de D&D."
-            )
-
-            # Llamar al conector (que maneja rotación y reintentos)
-            response_text, status = connector.query(full_prompt)
-
-            # Procesar respuesta o error
+async def _speculate_option(spec_prompt):
+    """
+    Prefetch especulativo de una rama de opción: pide la respuesta al conector
+    y la deja en dm_response_cache. Si el jugador elige esa opción, la petición
+    real será un hit instantáneo (solapa la latencia de la API con el tiempo de
+    lectura del jugador).
+    """
+    async with _speculation_limit:
+        if connector is None or game_over or SHUTDOWN.is_set():
+            return
+        prompt_key = _dm_cache_key(spec_prompt)
+        if prompt_key in dm_response_cache:
+            return
+        try:
+            response_text, status = await connector.aquery(spec_prompt)
+            # Solo memoizar respuestas reales de la API ("success" exacto):
+            # "success_cache" puede venir de la capa semántica del conector,
+            # es decir, de un prompt PARECIDO pero no este — persistirla bajo
+            # la clave exacta de esta rama envenenaría memo y dm_cache.db con
+            # la narración de otra opción.
             if status == "success" and response_text:
-                 result = response_text.strip()
-            else:
-                # Si hubo error, loguearlo y preparar mensaje de fallback
-                log_msg = f"... (API DM falló: {status}). Usando fallback narrativo simple."
-                gui_queue.put(("log", log_msg))
+                dm_response_cache[prompt_key] = response_text
+                _dm_cache_store(prompt_key, response_text)
+        except Exception:
+            pass # La especulación es oportunista: un fallo aquí no afecta al juego
+
+def _split_streamable(buf, final=False):
+    """
+    Separa un buffer de stream en (texto_emitible, resto_retenido).
+    Retiene un '[' final que todavía podría ser el comienzo de un tag del DM
+    (así nunca se pinta '[DAÑ' a medias) y oculta los tags completos, que se
+    aplican al final sobre el texto íntegro. Los corchetes de opciones ([1]...)
+    no casan con TAG_RE y se emiten tal cual.
+    """
+    out = []
+    i = 0
+    while i < len(buf):
+        lb = buf.find('[', i)
+        if lb == -1:
+            out.append(buf[i:])
+            break
+        out.append(buf[i:lb])
+        rb = buf.find(']', lb)
+        if rb == -1:
+            if final or len(buf) - lb > 40: # Demasiado largo para ser un tag
+                out.append(buf[lb:])
+                break
+            return "".join(out), buf[lb:] # Posible tag incompleto: retener
+        segment = buf[lb:rb + 1]
+        if not TAG_RE.fullmatch(segment):
+            out.append(segment) # Corchetes normales (p.ej. opciones numeradas)
+        i = rb + 1
+    return "".join(out), ""
+
+def _stream_dm_response(full_prompt):
+    """
+    Consume connector.query_stream en un hilo auxiliar y empuja el texto a la
+    gui_queue fragmento a fragmento: el primer token aparece en pantalla en
+    cientos de ms en vez de esperar la respuesta completa.
+
+    Returns:
+        Tupla (texto_acumulado, completo). completo es False si el stream se
+        cortó por /stop, por el cierre de la app o por una caída del proveedor
+        a mitad (StreamInterrupted): ese texto NO debe cachearse.
+    """
+    raw = ""
+    pending = ""
+    started = False
+    complete = False
+    stream_stop_event.clear()
+    try:
+        for chunk in connector.query_stream(full_prompt):
+            if SHUTDOWN.is_set():
+                break # Cierre de la app: abandonar el stream sin más ceremonia
+            if stream_stop_event.is_set():
+                queue_log("(Narración interrumpida)", "system")
+                break
+            raw += chunk
+            pending += chunk
+            emit, pending = _split_streamable(pending)
+            if emit:
+                if not started:
+                    gui_queue.append(("stream_start", None))
+                    started = True
+                gui_queue.append(("stream_chunk", emit))
+        else:
+            complete = True # El generador terminó por las buenas
+    except StreamInterrupted:
+        # El proveedor murió tras producir texto: mostrar lo que hay, pero
+        # dejar constancia (y complete queda False para no memoizarlo)
+        queue_log("(Narración interrumpida por un fallo del proveedor)", "system")
+    emit, _ = _split_streamable(pending, final=True)
+    if emit:
+        if not started:
+            gui_queue.append(("stream_start", None))
+            started = True
+        gui_queue.append(("stream_chunk", emit))
+    if started:
+        gui_queue.append(("stream_done", None))
+    return raw, complete
+
+async def _generation_task(prompt, callback):
+    """
+    Corrutina (a nivel de módulo, no closure por llamada) que consulta al DM
+    en el loop de fondo y pone (callback, resultado) en la gui_queue.
+
+    Args:
+        prompt (str): La TAREA ACTUAL o acción del jugador a procesar por la IA.
+        callback (callable): Función a llamar (en el hilo principal) con la respuesta.
+    """
+    result = None
+    status = "offline"
+    was_streamed = False
+    if connector:
+        # Construir el prompt con el builder compartido (ver build_dm_prompt)
+        full_prompt = build_dm_prompt(prompt, list(game_context)[-6:])
+
+        # Memo local primero; si falla, pedir en streaming (primer token rápido)
+        prompt_key = _dm_cache_key(full_prompt)
+        cached_response = dm_response_cache.get(prompt_key)
+        if cached_response is not None:
+            response_text, status = cached_response, "success_cache"
+        else:
+            complete = True
+            try:
+                # to_thread: el generador síncrono no bloquea el loop (especulación sigue)
+                response_text, complete = await asyncio.to_thread(_stream_dm_response, full_prompt)
+                if response_text:
+                    status = "success_stream"
+                    was_streamed = True
+            except RuntimeError:
+                # Ningún proveedor pudo iniciar el stream: ruta bloqueante clásica
+                response_text, status = await connector.aquery(full_prompt)
+            # No cachear streams incompletos (cortados con /stop, por cierre de
+            # la app o por caída del proveedor a mitad), ni resultados
+            # "success_cache" del fallback aquery: pueden salir de la capa
+            # semántica del conector (respuesta de un prompt parecido, no de
+            # ESTE) y quedarían persistidos bajo la clave exacta equivocada
+            if (status in ("success", "success_stream") and response_text
+                    and complete and not SHUTDOWN.is_set()):
+                dm_response_cache[prompt_key] = response_text
+                _dm_cache_store(prompt_key, response_text)
+
+        # Procesar respuesta o error ('success' o 'success_cache' si vino del cache del conector)
+        if status.startswith("success") and response_text:
+             result = response_text.strip()
+        else:
+            # Si hubo error, loguearlo y preparar mensaje de fallback
+            log_msg = f"... (API DM falló: {status}). Usando fallback narrativo simple."
+            queue_log(log_msg)
+            # Solo intentar parsear si parece JSON (evita pagar una excepción
+            # de json.loads por cada respuesta de error que es texto plano)
+            if response_text and response_text.lstrip().startswith('{'):
                 try:
-                    # Intentar parsear si el conector devuelve JSON en error
                     error_info = json.loads(response_text)
                     result = f"[Fallback por error API: {error_info.get('error', status)}. El DM está confundido. Intenta algo simple.]"
                 except (json.JSONDecodeError, TypeError):
                     result = f"[Fallback por error API: {status}. El DM está confundido. Intenta algo simple.]"
+            else:
+                result = f"[Fallback por error API: {status}. El DM está confundido. Intenta algo simple.]"
+
+    # Si no hay conector o falló todo, usar fallback básico
+    if result is None:
+        result = "El DM se queda en silencio... parece que la conexión se perdió. ¿Qué intentas hacer de todos modos?"
+        queue_log("... (Usando fallback offline directo).")
 
-        # Si no hay conector o falló todo, usar fallback básico
-        if result is None:
-            result = "El DM se queda en silencio... parece que la conexión se perdió. ¿Qué intentas hacer de todos modos?"
-            gui_queue.put(("log", "... (Usando fallback offline directo)."))
+    # Poner el resultado y el callback en la cola para el hilo principal.
+    # Si ya se pintó por streaming, el callback no debe volver a mostrar el texto.
+    if was_streamed:
+        gui_queue.append(("cb", (lambda text: callback(text, streamed=True), result)))
+    else:
+        gui_queue.append(("cb", (callback, result)))
 
-        # Poner el resultado y el callback en la cola para el hilo principal
-        gui_queue.put((callback, result))
+def ask_dm_ai(prompt: str, callback):
+    """
+    Envía una petición a la IA (actuando como DM) al loop de fondo.
+    El prompt completo (contexto, stats, instrucciones) lo construye
+    _generation_task; aquí solo se da feedback y se despacha la corrutina.
 
-    # Deshabilitar input y empezar tarea en hilo
+    Args:
+        prompt (str): La TAREA ACTUAL o acción del jugador a procesar por la IA.
+        callback (callable): La función a llamar (en el hilo principal) cuando se recibe la respuesta.
+    """
+    # Feedback visual inmediato en la GUI
+    add_log("... DM está pensando ...", "italic")
+    # Deshabilitar input y enviar la corrutina al loop de fondo
     set_input_state(tk.DISABLED)
-    run_in_thread(generation_task)
+    asyncio.run_coroutine_threadsafe(_generation_task(prompt, callback), dm_loop)
 
 def roll_dice(sides: int) -> int:
     """Simula tirar un dado de N caras."""
     return random.randint(1, sides)
 
+# Despacho de comandos de jugador: dict por comando en vez de cadena if/elif.
+# La búsqueda es O(1), los alias comparten handler y añadir un comando nuevo es
+# una función + sus entradas. Cada handler recibe el texto tras el comando
+# ("" si no hay argumento).
+def _cmd_inventory(arg): show_inventory()
+def _cmd_use(arg):
+    arg = arg.strip()
+    if arg: use_item(arg)
+    else: add_log("Uso: /usar <nombre del item>", "system")
+def _cmd_save(arg): save_game(); add_log("Partida guardada.", "system")
+def _cmd_load(arg): load_game()
+def _cmd_stats(arg): show_stats()
+def _cmd_help(arg): show_help()
+def _cmd_stop(arg): stream_stop_event.set(); add_log("(Deteniendo narración...)", "system")
+def _cmd_unknown(arg): add_log("Comando no reconocido. Escribe /ayuda para ver la lista.", "system")
+
+COMMANDS = {
+    "/inv": _cmd_inventory, "/inventario": _cmd_inventory,
+    "/usar": _cmd_use,
+    "/guardar": _cmd_save, "/save": _cmd_save,
+    "/cargar": _cmd_load, "/load": _cmd_load,
+    "/stats": _cmd_stats, "/hp": _cmd_stats,
+    "/ayuda": _cmd_help, "/help": _cmd_help,
+    "/stop": _cmd_stop,
+}
+
 def process_player_input(event=None):
     """
     Procesa la entrada del usuario desde el campo de texto.
@@ -298,82 +885,101 @@ def process_player_input(event=None):
     add_log(player_input, "player") # Mostrar input del jugador
     input_entry.delete(0, tk.END) # Limpiar campo
 
-    # Procesar comandos especiales que no van a la IA
-    command = player_input.lower()
-    if command == "/inv" or command == "/inventario": show_inventory(); return
-    elif command.startswith("/usar "): use_item(player_input[len("/usar "):].strip()); return
-    elif command == "/guardar" or command == "/save": save_game(); add_log("Partida guardada.", "system"); return
-    elif command == "/cargar" or command == "/load": load_game(); return
-    elif command == "/stats" or command == "/hp": show_stats(); return
-    elif command == "/ayuda" or command == "/help": show_help(); return
+    # Procesar comandos especiales que no van a la IA (despacho por dict)
+    if player_input.startswith("/"):
+        cmd, _, arg = player_input.partition(" ")
+        COMMANDS.get(cmd.lower(), _cmd_unknown)(arg)
+        return
+
+    # Si el jugador respondió con el número de una opción ofrecida, expandirla al
+    # texto de la opción: el DM recibe la acción real y el prompt coincide
+    # byte-a-byte con la rama ya especulada (hit de cache instantáneo)
+    if player_input in last_options:
+        player_input = last_options[player_input]
+        add_log(f"(Eliges: {player_input})", "system")
 
     # Si no es un comando, es una acción para el DM
-    game_context.append(f"Jugador: {player_input}")
+    push_context(f"Jugador: {player_input}")
     dm_request_prompt = f"El jugador acaba de decir: '{player_input}'. Procesa esta acción."
     # Pedir a la IA que procese la acción y responda
     ask_dm_ai(dm_request_prompt, handle_dm_response)
 
-def handle_dm_response(dm_text):
+# Despacho por tag: añadir un tag nuevo del DM es una función + una entrada aquí,
+# en vez de otra rama en una cadena if/elif dentro del extractor
+def _apply_damage(data, value): data["damage"] += int(value)
+def _apply_heal(data, value): data["heal"] += int(value)
+def _apply_xp(data, value): data["xp"] += int(value)
+def _apply_item(data, value): data["items"].append(value)
+
+_TAG_HANDLERS = {
+    "DAÑO": _apply_damage,
+    "CURA": _apply_heal,
+    "XP": _apply_xp,
+    "ITEM": _apply_item,
+}
+
+def _extract_and_clean(text):
     """
-    Callback ejecutado (desde el hilo principal vía cola) cuando se recibe la respuesta del DM.
-    Parsea la respuesta en busca de tags [DAÑO:X], [CURA:Y], [XP:Z], [ITEM:Nombre],
-    actualiza el estado del juego, muestra la narrativa limpia y reactiva la entrada.
+    Extrae los tags [DAÑO|CURA|XP|ITEM] en un solo pase de TAG_RE.sub y devuelve
+    (texto_limpio, datos_extraídos). A nivel de módulo (no closure por respuesta):
+    el dict de resultados se crea aquí y se devuelve, sin estado compartido.
     """
-    global game_over, player_stats, player_inventory
-
-    display_text = dm_text
     extracted_data = {"damage": 0, "heal": 0, "xp": 0, "items": []}
-    # Regex para encontrar tags como [TAG: Valor] (case-insensitive para TAG)
-    tag_pattern = r"\[(DAÑO|CURA|XP|ITEM):\s*([^\]]+)\]"
-
-    def extract_and_remove_tags(text):
-        """Función interna para buscar tags, extraer datos y limpiar texto."""
-        nonlocal display_text # Permitir modificar la variable externa
-        matches = list(re.finditer(tag_pattern, text, re.IGNORECASE)) # Ignorar mayus/minus en TAG
-
-        for match in reversed(matches): # Procesar de atrás hacia adelante
-            tag = match.group(1).upper() # Convertir tag a mayúsculas para consistencia
-            value_str = match.group(2).strip()
 
+    def collect_tag(match):
+        tag = match.group(1).upper() # Convertir tag a mayúsculas para consistencia
+        value_str = match.group(2).strip()
+        handler = _TAG_HANDLERS.get(tag)
+        if handler is not None:
             try:
-                if tag == "DAÑO": extracted_data["damage"] += int(value_str)
-                elif tag == "CURA": extracted_data["heal"] += int(value_str)
-                elif tag == "XP": extracted_data["xp"] += int(value_str)
-                elif tag == "ITEM": extracted_data["items"].append(value_str)
+                handler(extracted_data, value_str)
             except ValueError:
                 # Loguear error si el valor no es convertible (ej. [DAÑO: Mucho])
                 add_log(f"Advertencia: Valor no numérico en tag {tag}: '{value_str}'", "system")
+        return "" # Eliminar el tag completo del texto a mostrar
 
-            # Eliminar el tag completo del texto a mostrar
-            display_text = display_text[:match.start()] + display_text[match.end():]
+    return TAG_RE.sub(collect_tag, text).strip(), extracted_data
 
-        return display_text.strip() # Devolver texto sin tags
+def handle_dm_response(dm_text, streamed=False):
+    """
+    Callback ejecutado (desde el hilo principal vía cola) cuando se recibe la respuesta del DM.
+    Parsea la respuesta en busca de tags [DAÑO:X], [CURA:Y], [XP:Z], [ITEM:Nombre],
+    actualiza el estado del juego, muestra la narrativa limpia y reactiva la entrada.
+
+    Args:
+        dm_text (str): Respuesta completa del DM (con tags).
+        streamed (bool): True si el texto ya se pintó incrementalmente en el log
+                         (no volver a mostrarlo, solo aplicar estado y contexto).
+    """
+    global game_over, player_stats, player_inventory, last_options
 
-    # Limpiar el texto y añadirlo al log
-    cleaned_text = extract_and_remove_tags(dm_text)
-    add_log(cleaned_text, "dm")
+    # Limpiar el texto y añadirlo al log (salvo que ya se pintara por streaming)
+    cleaned_text, extracted_data = _extract_and_clean(dm_text)
+    if not streamed:
+        add_log(cleaned_text, "dm")
     # Guardar el texto limpio en el contexto para futuras llamadas a la IA
-    game_context.append(f"DM: {cleaned_text}")
+    push_context(f"DM: {cleaned_text}")
 
     # Aplicar los cambios de estado extraídos
     hp_changed = False
     if extracted_data["damage"] > 0:
-        player_stats["HP"] = player_stats.get("HP", 1) - extracted_data["damage"]
+        player_stats.HP -= extracted_data["damage"]
         add_log(f"(Recibiste {extracted_data['damage']} daño)", "system")
         hp_changed = True
     if extracted_data["heal"] > 0:
-        max_hp = player_stats.get("MaxHP", 1)
-        player_stats["HP"] = min(player_stats.get("HP", 0) + extracted_data["heal"], max_hp)
+        player_stats.HP = min(player_stats.HP + extracted_data["heal"], player_stats.MaxHP)
         add_log(f"(Te curaste {extracted_data['heal']} HP)", "system")
         hp_changed = True
     if extracted_data["items"]:
         for item in extracted_data["items"]:
             # Evitar añadir items vacíos si el parseo falla
             if item:
-                player_inventory.append(item)
+                canonical = item.lower()
+                player_inventory[canonical] += 1
+                item_display_names.setdefault(canonical, item)
                 add_log(f"(Obtuviste: {item})", "system")
     if extracted_data["xp"] > 0:
-        player_stats["XP"] = player_stats.get("XP", 0) + extracted_data["xp"]
+        player_stats.XP += extracted_data["xp"]
         add_log(f"(Ganaste {extracted_data['xp']} XP)", "system")
         check_level_up() # Comprobar si se sube de nivel (esto actualiza display si ocurre)
 
@@ -394,6 +1000,18 @@ def handle_dm_response(dm_text):
         # Poner foco de nuevo en el campo de entrada
         if input_entry: input_entry.focus_set()
 
+    # Prefetch especulativo: si el DM ofreció opciones numeradas, pedir ya esas
+    # ramas en segundo plano mientras el jugador lee y decide (máx. 2 en vuelo)
+    last_options = {}
+    if connector and not game_over:
+        context_snapshot = list(game_context)
+        for opt_num, action_text in itertools.islice(iter_options(cleaned_text), 2):
+            last_options[opt_num] = action_text
+            sim_context = (context_snapshot + [f"Jugador: {action_text}"])[-6:]
+            spec_prompt = build_dm_prompt(
+                f"El jugador acaba de decir: '{action_text}'. Procesa esta acción.", sim_context)
+            asyncio.run_coroutine_threadsafe(_speculate_option(spec_prompt), dm_loop)
+
 
 def check_level_up():
     """
@@ -402,30 +1020,29 @@ def check_level_up():
     Muestra un mensaje de felicitación.
     """
     global player_stats
-    current_xp = player_stats.get("XP", 0)
-    xp_next = player_stats.get("XP_Next_Level", 100)
-    current_level = player_stats.get("Level", 1)
+    current_xp = player_stats.XP
+    xp_next = player_stats.XP_Next_Level
 
     if current_xp >= xp_next:
         # Subida de nivel
-        player_stats["Level"] = current_level + 1
+        player_stats.Level += 1
         xp_overflow = current_xp - xp_next # XP sobrante
         # Aumento de stats (ejemplo simple)
         hp_gain = random.randint(3, 6)
-        old_max_hp = player_stats.get("MaxHP", 15)
-        player_stats["MaxHP"] = old_max_hp + hp_gain
-        player_stats["HP"] = player_stats["MaxHP"] # Curación completa al subir
+        old_max_hp = player_stats.MaxHP
+        player_stats.MaxHP = old_max_hp + hp_gain
+        player_stats.HP = player_stats.MaxHP # Curación completa al subir
         # Aumentar STR o DEX aleatoriamente
         stat_to_increase = random.choice(["STR", "DEX"])
-        old_stat_value = player_stats.get(stat_to_increase, 10)
-        player_stats[stat_to_increase] = old_stat_value + 1
+        old_stat_value = getattr(player_stats, stat_to_increase)
+        setattr(player_stats, stat_to_increase, old_stat_value + 1)
         # Nuevo umbral de XP (ejemplo: casi duplicar)
-        player_stats["XP_Next_Level"] = int(xp_next * 1.7 + 50)
-        player_stats["XP"] = xp_overflow # Conservar XP sobrante
+        player_stats.XP_Next_Level = int(xp_next * 1.7 + 50)
+        player_stats.XP = xp_overflow # Conservar XP sobrante
 
         # Notificar al jugador
-        add_log(f"¡Felicidades! ¡Has subido al Nivel {player_stats['Level']}!", "levelup")
-        add_log(f"(HP Max: {old_max_hp} -> {player_stats['MaxHP']}. {stat_to_increase}: {old_stat_value} -> {player_stats[stat_to_increase]})", "levelup")
+        add_log(f"¡Felicidades! ¡Has subido al Nivel {player_stats.Level}!", "levelup")
+        add_log(f"(HP Max: {old_max_hp} -> {player_stats.MaxHP}. {stat_to_increase}: {old_stat_value} -> {getattr(player_stats, stat_to_increase)})", "levelup")
 
         # Actualizar inmediatamente la GUI para reflejar el nivel y stats
         update_status_display()
@@ -435,9 +1052,12 @@ def show_inventory():
     if not player_inventory:
         add_log("Inventario vacío.", "system")
     else:
-        # Formatear lista para mejor lectura
-        inv_str = "\n".join([f"- {item}" for item in sorted(player_inventory)]) # Ordenado alfabéticamente
-        add_log("--- Inventario ---\n" + inv_str + "\n----------------", "system")
+        # Formatear lista para mejor lectura (ordenado alfabéticamente, con cantidades)
+        inv_lines = []
+        for canonical, count in sorted(player_inventory.items()):
+            name = item_display_names.get(canonical, canonical)
+            inv_lines.append(f"- {name} x{count}" if count > 1 else f"- {name}")
+        add_log("--- Inventario ---\n" + "\n".join(inv_lines) + "\n----------------", "system")
 
 def use_item(item_name_input):
     """
@@ -446,30 +1066,34 @@ def use_item(item_name_input):
     """
     global player_stats, player_inventory
 
-    found_item = None
-    item_index = -1
-    # Buscar el item (case-insensitive)
-    for i, item in enumerate(player_inventory):
-        if item_name_input.lower() in item.lower(): # Busca si el input está contenido en el nombre del item
-            found_item = item
-            item_index = i
+    found_key = None
+    # Buscar el item (los nombres canónicos ya están en minúsculas)
+    needle = item_name_input.lower()
+    for canonical in sorted(player_inventory):
+        if needle in canonical: # Busca si el input está contenido en el nombre del item
+            found_key = canonical
             break # Usar el primer item que coincida
 
-    if not found_item:
+    if not found_key:
         add_log(f"No tienes nada parecido a '{item_name_input}' en tu inventario.", "system")
         return
+    found_item = item_display_names.get(found_key, found_key)
 
     # Lógica específica para pociones
     # Podría extenderse con un diccionario de efectos de items si se quisiera
-    if "poción" in found_item.lower() or "potion" in found_item.lower():
+    if "poción" in found_key or "potion" in found_key:
         heal_amount = random.randint(4, 8) # Cura variable
-        max_hp = player_stats.get("MaxHP", 1)
-        current_hp = player_stats.get("HP", 0)
+        max_hp = player_stats.MaxHP
+        current_hp = player_stats.HP
         effective_heal = min(heal_amount, max_hp - current_hp) # No curar más allá del máximo
 
         if effective_heal > 0:
-            player_stats["HP"] = current_hp + effective_heal
-            player_inventory.pop(item_index) # Consumir item (eliminar por índice)
+            player_stats.HP = current_hp + effective_heal
+            player_inventory[found_key] -= 1 # Consumir una unidad
+            mark_state_dirty()
+            if player_inventory[found_key] <= 0:
+                del player_inventory[found_key]
+                item_display_names.pop(found_key, None)
             add_log(f"Usaste {found_item} y recuperaste {effective_heal} HP.", "system")
             update_status_display() # Actualizar HP en GUI
         else:
@@ -485,14 +1109,14 @@ def use_item(item_name_input):
 
 def show_stats():
      """Muestra las estadísticas detalladas del personaje."""
-     # Usar .get con valores por defecto por si alguna clave falta
+     # Atributos del dataclass PlayerStats: un typo de campo falla alto aquí
      stats_str = f"--- Estadísticas ---\n" \
-                 f" Nivel: {player_stats.get('Level', '?')}\n" \
-                 f" HP: {player_stats.get('HP', '?')} / {player_stats.get('MaxHP', '?')}\n" \
-                 f" XP: {player_stats.get('XP', '?')} / {player_stats.get('XP_Next_Level', '?')}\n" \
-                 f" Fuerza (STR): {player_stats.get('STR', '?')}\n" \
-                 f" Destreza (DEX): {player_stats.get('DEX', '?')}\n" \
-                 f" Notas: {player_stats.get('Notas', 'N/A')}\n" \
+                 f" Nivel: {player_stats.Level}\n" \
+                 f" HP: {player_stats.HP} / {player_stats.MaxHP}\n" \
+                 f" XP: {player_stats.XP} / {player_stats.XP_Next_Level}\n" \
+                 f" Fuerza (STR): {player_stats.STR}\n" \
+                 f" Destreza (DEX): {player_stats.DEX}\n" \
+                 f" Notas: {player_stats.Notas}\n" \
                  f"--------------------"
      add_log(stats_str, "system")
 
@@ -504,6 +1128,7 @@ def show_help():
                 "/stats | /hp         - Muestra tus estadísticas.\n" \
                 "/guardar | /save     - Guarda la partida.\n" \
                 "/cargar | /load     - Carga la última partida guardada.\n" \
+                "/stop (o tecla Esc)  - Corta la narración en streaming en curso.\n" \
                 "/ayuda | /help       - Muestra esta ayuda.\n" \
                 "---------------------------"
      add_log(help_str, "system")
@@ -523,39 +1148,49 @@ def start_game():
 def check_game_over():
     """Comprueba si HP <= 0 y actualiza el estado del juego."""
     global game_over
-    if player_stats.get("HP", 1) <= 0 and not game_over:
+    if player_stats.HP <= 0 and not game_over:
         game_over = True
-        add_log("\n" + "="*30 + "\n      GAME OVER\n" + "="*30, "bold")
+        mark_state_dirty()
         set_input_state(tk.DISABLED) # Deshabilitar input
-        add_log("Tu viaje ha terminado. Has sido consumido por el Vacío...", "bold")
-        add_log("\nEstadísticas Finales de la Sesión:")
-        for key, value in player_stats.items():
+        # Volcado final como un solo lote (una inserción por línea era costoso)
+        final_lines = [("\n" + "="*30 + "\n      GAME OVER\n" + "="*30, "bold"),
+                       ("Tu viaje ha terminado. Has sido consumido por el Vacío...", "bold"),
+                       ("\nEstadísticas Finales de la Sesión:", None)]
+        for key, value in player_stats.to_dict().items():
              formatted_key = key.replace('_', ' ').capitalize()
-             add_log(f"- {formatted_key}: {value}")
+             final_lines.append((f"- {formatted_key}: {value}", None))
         if player_inventory:
-            add_log("Inventario final: " + ", ".join(player_inventory))
+            final_lines.append(("Inventario final: " + format_inventory(), None))
+        add_log_batch(final_lines)
         # Considerar guardar automáticamente aquí o al cerrar
 
 # --- Persistencia (Guardar/Cargar) ---
 def save_game():
-    """Guarda el estado actual del juego en un archivo JSON."""
+    """Guarda el estado actual del juego en un archivo JSON (si cambió algo)."""
+    global _saved_version
+    if _state_version == _saved_version and os.path.exists(SAVE_FILE):
+        return True # Nada cambió desde el último guardado: no reserializar
     try:
-        # Guardar solo el contexto reciente
-        limited_context = game_context[-25:] # Guardar últimos 25 intercambios
+        # La deque ya está acotada a CONTEXT_MAXLEN; solo convertir para JSON
+        limited_context = list(game_context)
 
         save_data = {
-            "player_stats": player_stats,
-            "player_inventory": player_inventory,
+            "player_stats": player_stats.to_dict(),
+            "player_inventory": dict(player_inventory),
+            "item_display_names": item_display_names,
             "game_context": limited_context,
             "game_over": game_over
         }
-        with open(SAVE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(save_data, f, indent=4, ensure_ascii=False)
+        # JSON compacto + gzip (nivel 1: compresión rápida, suficiente para texto);
+        # reduce el tamaño y el tiempo de escritura del autoguardado
+        with gzip.open(SAVE_FILE, 'wt', encoding='utf-8', compresslevel=1) as f:
+            json.dump(save_data, f, separators=(',', ':'), ensure_ascii=False)
+        _saved_version = _state_version
         # No loguear aquí si se llama desde on_closing o comando /save
         return True
     except Exception as e:
         # Usar la cola para loguear error de forma segura si ocurre en on_closing
-        gui_queue.put(("log", f"Error al guardar partida: {e}"))
+        queue_log(f"Error al guardar partida: {e}")
         return False
 
 def load_game():
@@ -563,51 +1198,63 @@ def load_game():
     Carga el estado del juego desde SAVE_FILE si existe.
     Actualiza las variables globales y pone tareas en cola para actualizar GUI.
     """
-    global player_stats, player_inventory, game_context, game_over
+    global player_stats, player_inventory, item_display_names, game_context, game_over
+    global _saved_version
     try:
         if os.path.exists(SAVE_FILE):
-            with open(SAVE_FILE, 'r', encoding='utf-8') as f:
+            # Detectar por los bytes mágicos si el guardado es gzip o JSON plano
+            # (compatibilidad con partidas guardadas por versiones anteriores)
+            with open(SAVE_FILE, 'rb') as f:
+                is_gzip = f.read(2) == b'\x1f\x8b'
+            opener = gzip.open if is_gzip else open
+            with opener(SAVE_FILE, 'rt', encoding='utf-8') as f:
                 load_data = json.load(f)
 
             # Validar datos cargados (muy básico)
             if isinstance(load_data.get("player_stats"), dict) and \
-               isinstance(load_data.get("player_inventory"), list) and \
+               isinstance(load_data.get("player_inventory"), (list, dict)) and \
                isinstance(load_data.get("game_context"), list):
 
                 # Restaurar estado
-                player_stats = load_data["player_stats"]
-                player_inventory = load_data["player_inventory"]
-                game_context = load_data["game_context"]
+                player_stats = PlayerStats.from_dict(load_data["player_stats"])
+                loaded_inv = load_data["player_inventory"]
+                if isinstance(loaded_inv, list): # Formato legacy: lista con repetidos
+                    player_inventory = collections.Counter(item.lower() for item in loaded_inv)
+                    item_display_names = {item.lower(): item for item in loaded_inv}
+                else:
+                    player_inventory = collections.Counter(loaded_inv)
+                    item_display_names = dict(load_data.get("item_display_names", {}))
+                game_context = collections.deque(load_data["game_context"], maxlen=CONTEXT_MAXLEN)
                 game_over = load_data.get("game_over", False) # Cargar estado game_over
+                _saved_version = _state_version # Lo cargado ya está en disco
 
-                # Poner tareas en cola para actualizar la GUI y log
-                gui_queue.put(("log", "Partida anterior cargada."))
-                gui_queue.put(("log", "--- Contexto Cargado ---"))
-                # Usar un comando especial en cola para añadir logs múltiples
-                log_tasks = []
+                # Toda la carga viaja como UNA ráfaga de log: el consumidor
+                # hace un solo ciclo de inserción para cabecera + contexto + pie
+                log_lines = [("Partida anterior cargada.", None),
+                             ("--- Contexto Cargado ---", None)]
                 for entry in game_context:
-                     if entry.startswith("Jugador:"): log_tasks.append(("add_log", (entry[len("Jugador:"):].strip(), "player")))
-                     elif entry.startswith("DM:"): log_tasks.append(("add_log", (entry[len("DM:"):].strip(), "dm")))
-                     else: log_tasks.append(("add_log", (entry, "system")))
-                gui_queue.put(("process_log_batch", log_tasks)) # Comando para procesar lote de logs
-                gui_queue.put(("log", "--- Fin Contexto Cargado ---"))
-                gui_queue.put(("update_status", None)) # Actualizar labels de status
+                     if entry.startswith("Jugador:"): log_lines.append((entry[len("Jugador:"):].strip(), "player"))
+                     elif entry.startswith("DM:"): log_lines.append((entry[len("DM:"):].strip(), "dm"))
+                     else: log_lines.append((entry, "system"))
+                log_lines.append(("--- Fin Contexto Cargado ---", None))
+                queue_log_batch(log_lines)
+                gui_queue.append(("update_status", None)) # Actualizar labels de status
 
                 if game_over:
-                    gui_queue.put(("log", "Esta partida guardada ya había terminado."))
-                    gui_queue.put(("set_input_state", tk.DISABLED)) # Deshabilitar input
+                    queue_log("Esta partida guardada ya había terminado.")
+                    gui_queue.append(("set_input_state", tk.DISABLED)) # Deshabilitar input
 
             else:
                 # Archivo corrupto
-                gui_queue.put(("log", "Error: Archivo de guardado corrupto o inválido. Iniciando nueva partida."))
-                player_stats = DEFAULT_PLAYER_STATS.copy(); player_inventory = []; game_context = ["Inicio de la Aventura"]; game_over = False; # Reset state
+                queue_log("Error: Archivo de guardado corrupto o inválido. Iniciando nueva partida.")
+                player_stats = PlayerStats(); player_inventory = collections.Counter(); item_display_names = {}; game_context = collections.deque(["Inicio de la Aventura"], maxlen=CONTEXT_MAXLEN); game_over = False; # Reset state
         else:
              # No hay archivo, empezar juego nuevo (no hacer nada aquí, initialize_connector lo maneja)
-             gui_queue.put(("log", "No se encontró partida guardada. Iniciando nueva aventura."))
+             queue_log("No se encontró partida guardada. Iniciando nueva aventura.")
 
     except Exception as e:
-        gui_queue.put(("log", f"Error crítico al cargar partida: {e}. Iniciando nueva partida."))
-        player_stats = DEFAULT_PLAYER_STATS.copy(); player_inventory = []; game_context = ["Inicio de la Aventura"]; game_over = False; # Reset state
+        queue_log(f"Error crítico al cargar partida: {e}. Iniciando nueva partida.")
+        player_stats = PlayerStats(); player_inventory = collections.Counter(); item_display_names = {}; game_context = collections.deque(["Inicio de la Aventura"], maxlen=CONTEXT_MAXLEN); game_over = False; # Reset state
 
 
 def on_closing():
@@ -630,53 +1277,103 @@ def on_closing():
         should_quit = True
 
     if should_quit:
-        # Limpiar cola y detener el bucle after (intentar)
-        # (Esto es difícil de garantizar perfectamente con hilos daemon)
-        # Poner None puede servir como señal para process_gui_queue
-        gui_queue.put(None) 
+        global _alive
+        _alive = False # Los callbacks/bombeos residuales pasan a no-op
+        SHUTDOWN.set() # Cancelación cooperativa: los trabajadores abortan solos
+        # Cerrar ordenadamente la sesión async del conector y parar el loop DM
+        try:
+            if connector:
+                asyncio.run_coroutine_threadsafe(connector.aclose(), dm_loop).result(timeout=2)
+        except Exception:
+            pass # Mejor salir que colgarse esperando la red
+        dm_loop.call_soon_threadsafe(dm_loop.stop)
+        # Descartar trabajo de fondo pendiente sin esperarlo (no colgar el cierre)
+        DM_POOL.shutdown(wait=False, cancel_futures=True)
         window.destroy() # Cierra la ventana
 
 # --- Procesador de Cola GUI (Corregido y Ampliado) ---
+# Cadencia adaptativa del bombeo de la cola GUI: rápido mientras llegan mensajes,
+# retrocediendo hasta un máximo cuando está ociosa (menos despertares de Tk)
+GUI_PUMP_BUSY_MS = 50
+GUI_PUMP_IDLE_MAX_MS = 500
+_idle_cycles = 0
+
+def _handle_callback(payload):
+    """Mensaje ("cb", (fn, resultado)): ejecutar el callback en el hilo principal."""
+    fn, result = payload
+    if _alive:
+        fn(result)
+
+# Tabla de despacho de la cola GUI: todos los productores empujan tuplas
+# (tag, payload); añadir un tipo de mensaje nuevo es una entrada aquí. Los tags
+# de log ("log"/"add_log"/"process_log_batch") y "update_status" no aparecen
+# porque el drenador los trata aparte: los logs se agrupan para insertarse en
+# lote y los update_status se colapsan a un refresco (ver process_gui_queue).
+HANDLERS = {
+    "cb": _handle_callback,
+    "start_game": lambda _payload: start_game(),
+    "set_input_state": set_input_state,
+    "stream_start": lambda _payload: _stream_insert("DM: ", DM_PREFIX_TAGS),
+    "stream_chunk": _stream_insert,
+    "stream_done": lambda _payload: _stream_insert("\n\n"),
+}
+
 def process_gui_queue():
-    """Procesa eventos puestos en la cola (llamado periódicamente por Tkinter)."""
+    """
+    Drena la cola GUI en un solo pase y aplica los mensajes por lotes (llamado
+    periódicamente por Tkinter). Las líneas de log acumuladas se insertan con un
+    único ciclo NORMAL/inserts/see/DISABLED; el resto se despacha en orden. El
+    reagendado es adaptativo: 50ms mientras hay tráfico, hasta 500ms en reposo.
+    """
+    global _idle_cycles
+    if SHUTDOWN.is_set():
+        return # Apagado: detener el bucle after sin drenar nada más
+    items = []
     try:
-        while not gui_queue.empty():
-            message = gui_queue.get_nowait()
-
-            # Señal de salida
-            if message is None: 
-                return # Detener el bucle after
-
-            # Procesar diferentes tipos de mensajes/tareas
+        while True:
+            items.append(gui_queue.popleft())
+    except IndexError:
+        pass # Cola drenada
+
+    log_batch = [] # (mensaje, tag) acumulados para un único ciclo de inserción
+    tasks = [] # Mensajes no-log, en orden de llegada
+    status_requested = False # N mensajes "update_status" -> un solo refresco
+    try:
+        for message in items:
             if isinstance(message, tuple) and len(message) == 2:
                 item1, item2 = message
-                if callable(item1): # (callback, result)
-                    callback = item1; result = item2
-                    if window and window.winfo_exists(): callback(result)
-                elif item1 == "log": add_log(item2) # ("log", "mensaje")
-                elif item1 == "add_log": # ("add_log", (mensaje, tag))
-                    log_msg, log_tag = item2
-                    add_log(log_msg, log_tag)
-                elif item1 == "update_status": update_status_display() # ("update_status", None)
-                elif item1 == "start_game": start_game() # ("start_game", None)
-                elif item1 == "set_input_state": set_input_state(item2) # ("set_input_state", state)
+                if item1 == "log": log_batch.append((item2, None)) # ("log", "mensaje")
+                elif item1 == "add_log": log_batch.append(item2) # ("add_log", (mensaje, tag))
                 elif item1 == "process_log_batch": # ("process_log_batch", [(type, (msg, tag)),...])
-                     log_tasks = item2
-                     for task_type, task_data in log_tasks:
-                          if task_type == "add_log": add_log(task_data[0], task_data[1])
-                else: add_log(f"Msg cola desc (tupla len 2): {message}")
-            elif isinstance(message, str): add_log(message) # Mensaje de log simple
-            else: add_log(f"Msg cola desc (otro tipo): {message}")
-
-    except queue.Empty:
-        pass # Normal si la cola está vacía
+                    log_batch.extend(task_data for task_type, task_data in item2
+                                     if task_type == "add_log")
+                elif item1 == "update_status": status_requested = True # Colapsar a uno por drenado
+                else: tasks.append((item1, item2))
+            elif isinstance(message, str): log_batch.append((message, None)) # Mensaje de log simple
+            else: log_batch.append((f"Msg cola desc (otro tipo): {message}", None))
+
+        if log_batch:
+            add_log_batch(log_batch)
+        for tag_name, payload in tasks:
+            handler = HANDLERS.get(tag_name)
+            if handler is not None:
+                handler(payload)
+            else:
+                add_log(f"Msg cola desc (tupla len 2): {(tag_name, payload)}")
+        if status_requested:
+            update_status_display() # Un único refresco para toda la ráfaga
     except Exception as e:
         # Imprimir error a consola para depuración
         print(f"Error procesando cola GUI: {e}")
 
-    # Volver a programar la revisión de la cola si la ventana existe
-    if window and window.winfo_exists():
-         window.after(100, process_gui_queue) # Revisar cada 100ms
+    # Si el jugador estaba releyendo y ya volvió abajo, volcar lo diferido
+    _flush_pending_log()
+
+    # Reagendado adaptativo: resetear el contador de ocio si hubo tráfico
+    _idle_cycles = 0 if items else _idle_cycles + 1
+    delay = GUI_PUMP_BUSY_MS if items else min(GUI_PUMP_IDLE_MAX_MS, 100 * _idle_cycles)
+    if _alive and window:
+         window.after(delay, process_gui_queue)
 
 
 # ==============================================================
@@ -688,27 +1385,40 @@ window.geometry("750x650")
 window.configure(bg="#ECECEC") # Fondo gris claro
 
 # --- Estilos y Fuentes ---
-font_normal = ("Segoe UI", 10)
-font_bold = ("Segoe UI", 10, "bold")
-font_italic = ("Segoe UI", 10, "italic")
-font_title = ("Segoe UI", 12, "bold")
+# Objetos tkfont.Font creados UNA vez (requieren una root viva, por eso van aquí).
+# Al pasarlos a style.configure/tag_config Tk recibe el nombre de una fuente ya
+# registrada, en vez de re-parsear la tupla ("Segoe UI", 10, ...) en cada
+# configuración de widget/tag.
+font_normal = tkfont.Font(family="Segoe UI", size=10)
+font_bold = tkfont.Font(family="Segoe UI", size=10, weight="bold")
+font_italic = tkfont.Font(family="Segoe UI", size=10, slant="italic")
+font_title = tkfont.Font(family="Segoe UI", size=12, weight="bold")
 
 # --- Configurar Estilos TTK ---
 style = ttk.Style()
-available_themes = style.theme_names()
-# Preferir temas más modernos si están disponibles
-if 'clam' in available_themes: style.theme_use('clam')
-elif 'vista' in available_themes: style.theme_use('vista')
-
-style.configure('TButton', font=font_bold, padding=(10, 5))
-style.configure('TLabel', font=font_normal, background="#ECECEC", padding=2)
-style.configure('Bold.TLabel', font=font_bold, background="#ECECEC")
-style.configure('Status.TLabel', font=font_normal, background="#F5F5F5", padding=5)
-style.configure('TFrame', background="#ECECEC")
-style.configure('Card.TFrame', background="#F5F5F5", relief=tk.SOLID, borderwidth=1)
-style.configure('TLabelframe', background="#F5F5F5", padding=10)
-style.configure('TLabelframe.Label', font=font_bold, background="#F5F5F5", foreground="#333333")
-style.configure('TEntry', font=font_normal, padding=5)
+# Elegir tema por lista de preferencia sobre un set (una sola consulta a
+# theme_names y búsquedas hasheadas, en vez de un escaneo lineal por candidato)
+available_themes = set(style.theme_names())
+for _theme in ('clam', 'vista', 'aqua'):
+    if _theme in available_themes:
+        style.theme_use(_theme)
+        break
+
+# Estilos data-driven: todas las configuraciones en un dict y un único bucle
+# (añadir un estilo nuevo es una entrada, no otra línea de style.configure)
+_STYLE_SPECS = {
+    'TButton': {"font": font_bold, "padding": (10, 5)},
+    'TLabel': {"font": font_normal, "background": "#ECECEC", "padding": 2},
+    'Bold.TLabel': {"font": font_bold, "background": "#ECECEC"},
+    'Status.TLabel': {"font": font_normal, "background": "#F5F5F5", "padding": 5},
+    'TFrame': {"background": "#ECECEC"},
+    'Card.TFrame': {"background": "#F5F5F5", "relief": tk.SOLID, "borderwidth": 1},
+    'TLabelframe': {"background": "#F5F5F5", "padding": 10},
+    'TLabelframe.Label': {"font": font_bold, "background": "#F5F5F5", "foreground": "#333333"},
+    'TEntry': {"font": font_normal, "padding": 5},
+}
+for _style_name, _style_opts in _STYLE_SPECS.items():
+    style.configure(_style_name, **_style_opts)
 
 # --- Layout Principal (Frames TTK) ---
 top_frame = ttk.Frame(window, padding=5); top_frame.pack(side=tk.TOP, fill=tk.X, padx=5, pady=(5,0))
@@ -720,31 +1430,55 @@ status_card = ttk.Frame(top_frame, style='Card.TFrame', padding=10)
 status_card.pack(fill=tk.X, padx=10, pady=5)
 status_labels_frame = ttk.Frame(status_card, style='Card.TFrame') # Usar mismo estilo que card para fondo
 status_labels_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
-hp_label = ttk.Label(status_labels_frame, text="HP: ?/?", style='Status.TLabel'); hp_label.pack(side=tk.LEFT, padx=(0,15))
-stats_label = ttk.Label(status_labels_frame, text="STR: ? | DEX: ?", style='Status.TLabel'); stats_label.pack(side=tk.LEFT, padx=15)
-xp_label = ttk.Label(status_labels_frame, text="Lvl: ? | XP: ?/?", style='Status.TLabel'); xp_label.pack(side=tk.LEFT, padx=15)
-connector_label = ttk.Label(status_card, text=f"API: {connector_status}", anchor=tk.E, style='Status.TLabel')
+# StringVars ligadas a los labels de estado (ver _flush_status_display)
+hp_var = tk.StringVar(value="HP: ?/?")
+stats_var = tk.StringVar(value="STR: ? | DEX: ?")
+xp_var = tk.StringVar(value="Lvl: ? | XP: ?/?")
+connector_var = tk.StringVar(value=f"API: {connector_status}")
+hp_label = ttk.Label(status_labels_frame, textvariable=hp_var, style='Status.TLabel'); hp_label.pack(side=tk.LEFT, padx=(0,15))
+stats_label = ttk.Label(status_labels_frame, textvariable=stats_var, style='Status.TLabel'); stats_label.pack(side=tk.LEFT, padx=15)
+xp_label = ttk.Label(status_labels_frame, textvariable=xp_var, style='Status.TLabel'); xp_label.pack(side=tk.LEFT, padx=15)
+connector_label = ttk.Label(status_card, textvariable=connector_var, anchor=tk.E, style='Status.TLabel')
 connector_label.pack(side=tk.RIGHT)
 
 # --- Widgets Medios (Log) ---
+# tk.Text + ttk.Scrollbar explícitos en vez de ScrolledText: el mismo widget
+# por debajo, pero con el yscrollcommand en nuestras manos (_on_yscroll), que
+# es lo que alimenta el flag de "viewport al final" del modo lectura.
 log_frame = ttk.Frame(middle_frame); log_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-log_area = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, height=20, font=font_normal, state=tk.DISABLED, bd=1, relief=tk.SOLID, padx=5, pady=5)
-log_area.pack(fill=tk.BOTH, expand=True)
-# Configurar tags (colores y espaciado)
-log_area.tag_config("player_tag", foreground="#00008B", font=font_bold)
-log_area.tag_config("dm_tag", foreground="#006400", font=font_bold)
-log_area.tag_config("dm_text", lmargin1=15, lmargin2=15, spacing3=8)
-log_area.tag_config("roll_tag", foreground="#8A2BE2", font=font_italic)
-log_area.tag_config("bold", font=font_bold)
-log_area.tag_config("italic", font=font_italic)
-log_area.tag_config("system_tag", foreground="#555555", font=font_italic) # Gris un poco más oscuro
-try: log_area.tag_config("levelup_tag", foreground="orange", font=font_bold)
-except tk.TclError: log_area.tag_config("levelup_tag", foreground="#FF8C00", font=font_bold) # Naranja oscuro
+log_scroll = ttk.Scrollbar(log_frame)
+log_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+log_area = tk.Text(log_frame, wrap=tk.WORD, height=20, font=font_normal, state=tk.DISABLED, bd=1, relief=tk.SOLID, padx=5, pady=5, yscrollcommand=_on_yscroll)
+log_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+log_scroll.config(command=log_area.yview)
+# Especificación de tags (colores y espaciado), data-driven: añadir un estilo
+# nuevo es una entrada en el dict. El registro real es perezoso (_ensure_tags):
+# cada tag se configura en Tcl la primera vez que una línea lo usa.
+# Resolver de antemano si este Tk conoce el color 'orange' (una sonda única,
+# en vez de capturar TclError en cada tag_config)
+try:
+    window.winfo_rgb("orange")
+    _LEVELUP_COLOR = "orange"
+except tk.TclError:
+    _LEVELUP_COLOR = "#FF8C00" # Naranja oscuro como aproximación
+TAG_SPECS = {
+    "player_tag": {"foreground": "#00008B", "font": font_bold},
+    "dm_tag": {"foreground": "#006400", "font": font_bold},
+    "dm_text": {"lmargin1": 15, "lmargin2": 15, "spacing3": 8},
+    "roll_tag": {"foreground": "#8A2BE2", "font": font_italic},
+    "bold": {"font": font_bold},
+    "italic": {"font": font_italic},
+    "system_tag": {"foreground": "#555555", "font": font_italic}, # Gris un poco más oscuro
+    "levelup_tag": {"foreground": _LEVELUP_COLOR, "font": font_bold},
+}
 
 # --- Widgets Inferiores (Entrada) ---
 input_entry = ttk.Entry(bottom_frame, font=font_normal)
 input_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(10, 5), pady=5)
 input_entry.bind("<Return>", process_player_input)
+# Escape corta el streaming en curso (el campo de entrada está deshabilitado
+# mientras se genera, así que /stop no siempre es alcanzable)
+window.bind("<Escape>", lambda e: stream_stop_event.set())
 send_button = ttk.Button(bottom_frame, text="Enviar", command=process_player_input, style='TButton')
 send_button.pack(side=tk.RIGHT, padx=(0, 10), pady=5)
 
@@ -758,8 +1492,10 @@ add_log("--- Bienvenido a Micro Calabozos y Chatbots v2.1 ---")
 add_log("Cargando estado y conectando a APIs...", "system")
 add_log("Escribe '/ayuda' para ver los comandos disponibles.", "system")
 
-# Inicializa conector y carga partida (síncrono)
-initialize_connector()
+# Inicializa conector y carga partida en segundo plano, tras el primer pintado:
+# la ventana aparece al instante y el sondeo de APIs (que puede tardar segundos)
+# no bloquea el arranque. Todo el resultado llega vía gui_queue, como siempre.
+window.after(0, lambda: run_in_thread(initialize_connector))
 
 # Actualiza display inicial
 update_status_display()